@@ -0,0 +1,183 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Order, OrderItem
+
+# Keeps each IN (...) list well under SQLite's bound parameter limit
+ROLLUP_CHUNK_SIZE = 500
+
+# DailySales counter bumped when an order enters each status
+STATUS_COUNTERS = {
+    'approved': 'orders_approved',
+    'rejected': 'orders_rejected',
+    'completed': 'orders_completed',
+}
+
+_MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _add_daily(day, **increments):
+    DailySales.objects.bulk_create([DailySales(date=day)], ignore_conflicts=True)
+    DailySales.objects.filter(date=day).update(**{field: F(field) + value for field, value in increments.items()})
+
+
+def _add_products(day, totals):
+    """Add ``{product_id: (units, revenue)}`` to the day's product rows in two queries."""
+    if not totals:
+        return
+    DailyProductSales.objects.bulk_create(
+        [DailyProductSales(date=day, product_id=product_id) for product_id in totals], ignore_conflicts=True,
+    )
+    DailyProductSales.objects.filter(date=day, product_id__in=totals).update(
+        units=F('units') + Case(
+            *[When(product_id=product_id, then=Value(units)) for product_id, (units, _) in totals.items()],
+            default=Value(0), output_field=IntegerField(),
+        ),
+        revenue=F('revenue') + Case(
+            *[When(product_id=product_id, then=Value(revenue)) for product_id, (_, revenue) in totals.items()],
+            default=Value(Decimal('0')), output_field=_MONEY,
+        ),
+    )
+
+
+def record_order_placed(order):
+    """Count a new pending order in its day's rollup. Call inside the checkout transaction."""
+    _add_daily(timezone.localdate(order.created_at), orders_placed=1, placed_amount=order.total_amount)
+
+
+def record_transition(orders, to_status, at):
+    """
+    Count ``orders`` entering ``to_status`` at ``at`` in the daily rollups.
+    Completions also add their revenue and the units of every line to the
+    product rollups. Call inside the transaction that moves the orders.
+    """
+    if not orders:
+        return
+    day = timezone.localdate(at)
+    increments = {STATUS_COUNTERS[to_status]: len(orders)}
+    if to_status == 'completed':
+        increments['revenue'] = sum(order.total_amount for order in orders)
+        order_ids = [order.id for order in orders]
+        totals = {}
+        for start in range(0, len(order_ids), ROLLUP_CHUNK_SIZE):
+            lines = (
+                OrderItem.objects.filter(order_id__in=order_ids[start:start + ROLLUP_CHUNK_SIZE])
+                .values('product_id')
+                .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=_MONEY))
+            )
+            for line in lines:
+                units, revenue = totals.get(line['product_id'], (0, Decimal('0')))
+                totals[line['product_id']] = (units + line['units'], revenue + line['revenue'])
+        increments['units_sold'] = sum(units for units, _ in totals.values())
+        _add_products(day, totals)
+    _add_daily(day, **increments)
+
+
+def _day_bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def rebuild_rollups(start, end):
+    """
+    Recompute the rollups for the days ``start`` to ``end`` (inclusive)
+    from the orders themselves, replacing what is stored. Used to backfill
+    history and to repair drift; run it in a transaction.
+    """
+    since, until = _day_bounds(start, end)
+    DailySales.objects.filter(date__range=(start, end)).delete()
+    DailyProductSales.objects.filter(date__range=(start, end)).delete()
+
+    days = {}
+
+    def day_row(day):
+        return days.setdefault(day, DailySales(date=day))
+
+    placed = (
+        Order.objects.filter(created_at__gte=since, created_at__lt=until)
+        .annotate(day=TruncDate('created_at')).values('day')
+        .annotate(orders=Count('id'), amount=Sum('total_amount'))
+    )
+    for row in placed:
+        day_row(row['day']).orders_placed = row['orders']
+        day_row(row['day']).placed_amount = row['amount'] or 0
+
+    for status, counter in STATUS_COUNTERS.items():
+        column = f'{status}_at'
+        moved = (
+            Order.objects.filter(**{f'{column}__gte': since, f'{column}__lt': until})
+            .annotate(day=TruncDate(column)).values('day')
+            .annotate(orders=Count('id'), amount=Sum('total_amount'))
+        )
+        for row in moved:
+            setattr(day_row(row['day']), counter, row['orders'])
+            if status == 'completed':
+                day_row(row['day']).revenue = row['amount'] or 0
+
+    products = []
+    lines = (
+        OrderItem.objects.filter(order__completed_at__gte=since, order__completed_at__lt=until)
+        .annotate(day=TruncDate('order__completed_at')).values('day', 'product_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=_MONEY))
+    )
+    for row in lines:
+        day_row(row['day']).units_sold += row['units']
+        products.append(DailyProductSales(
+            date=row['day'], product_id=row['product_id'], units=row['units'], revenue=row['revenue'],
+        ))
+
+    DailySales.objects.bulk_create(days.values(), batch_size=ROLLUP_CHUNK_SIZE)
+    DailyProductSales.objects.bulk_create(products, batch_size=ROLLUP_CHUNK_SIZE)
+    return len(days), len(products)
+
+
+def dashboard_summary(days=30, top=10):
+    """
+    Sales figures for the admin dashboard over the last ``days`` days, read
+    from the rollups only: a per-day series for the charts, totals, the
+    best-selling products and the revenue share of each category.
+    """
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    rows = {row.date: row for row in DailySales.objects.filter(date__range=(start, end))}
+    series = [rows.get(start + timedelta(days=offset)) or DailySales(date=start + timedelta(days=offset))
+              for offset in range(days)]
+    peak = max((row.revenue for row in series), default=0) or 1
+    chart = [{'row': row, 'height': round(100 * row.revenue / peak)} for row in series]
+
+    revenue = sum(row.revenue for row in series)
+    completed = sum(row.orders_completed for row in series)
+    placed = sum(row.orders_placed for row in series)
+    product_sales = DailyProductSales.objects.filter(date__range=(start, end))
+    top_products = list(
+        product_sales.values('product_id', 'product__name')
+        .annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('-revenue')[:top]
+    )
+    categories = list(
+        product_sales.values('product__category__name')
+        .annotate(revenue=Sum('revenue')).order_by('-revenue')
+    )
+    category_total = sum(category['revenue'] for category in categories)
+    for category in categories:
+        category['share'] = round(100 * category['revenue'] / category_total) if category_total else 0
+
+    return {
+        'days': days,
+        'chart': chart,
+        'revenue': revenue,
+        'orders_placed': placed,
+        'orders_completed': completed,
+        'orders_rejected': sum(row.orders_rejected for row in series),
+        'average_order_value': revenue / completed if completed else 0,
+        'completion_rate': round(100 * completed / placed) if placed else 0,
+        'top_products': top_products,
+        'categories': categories,
+    }
+
@@ -4,3 +4,28 @@ from django.apps import AppConfig
 class MiniCatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Mini_catalog'
+
+    def ready(self):
+        from django.core.checks import register
+        from django.db.models.signals import post_save, post_delete
+        from .carousel import check_default_cache, invalidate_slides
+        from .categories import clear_categories
+        from .models import Category, Order, Product, library
+        from .pagecache import purge_pages
+        from .search import index_product, unindex_product
+        from .sessions import check_session_cache
+        from .uploads import release_proof
+
+        register(check_default_cache)
+        register(check_session_cache)
+        post_save.connect(clear_categories, sender=Category, dispatch_uid='categories_save')
+        post_delete.connect(clear_categories, sender=Category, dispatch_uid='categories_delete')
+        post_save.connect(index_product, sender=Product, dispatch_uid='search_index_product')
+        post_delete.connect(unindex_product, sender=Product, dispatch_uid='search_unindex_product')
+        post_save.connect(invalidate_slides, sender=library, dispatch_uid='carousel_save')
+        post_delete.connect(invalidate_slides, sender=library, dispatch_uid='carousel_delete')
+        post_delete.connect(release_proof, sender=Order, dispatch_uid='proof_release')
+        # Connected last so pages are purged after the data they render is reloaded
+        for model in (Product, Category, library):
+            post_save.connect(purge_pages, sender=model, dispatch_uid=f'page_cache_save_{model.__name__}')
+            post_delete.connect(purge_pages, sender=model, dispatch_uid=f'page_cache_delete_{model.__name__}')
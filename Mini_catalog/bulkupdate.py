@@ -0,0 +1,30 @@
+from django.db import connections
+
+from .models import Product
+
+
+def bulk_update_products(fields, rows, using):
+    """
+    Write ``fields`` for ``(pk, values)`` rows, ``values`` being a dict keyed
+    by attname, with one parameterised UPDATE run through executemany. Each
+    row's version is bumped too, since there is no save() to do it and
+    cached product cards are keyed on it.
+
+    Product.objects.bulk_update would build a CASE WHEN per row and field,
+    which costs milliseconds a row in Python alone.
+    """
+    connection = connections[using]
+    fields = [Product._meta.get_field(name) for name in fields]
+    quote = connection.ops.quote_name
+    version = quote('version')
+    sql = 'UPDATE {} SET {}, {} = {} + 1 WHERE {} = %s'.format(
+        quote(Product._meta.db_table),
+        ', '.join(f'{quote(field.column)} = %s' for field in fields),
+        version, version, quote(Product._meta.pk.column),
+    )
+    params = [
+        [field.get_db_prep_save(values[field.attname], connection) for field in fields] + [pk]
+        for pk, values in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
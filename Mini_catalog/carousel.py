@@ -0,0 +1,94 @@
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from .models import library
+
+# Widths (px) of the Cloudinary variants offered in each slide's srcset
+CAROUSEL_WIDTHS = [480, 960, 1600]
+
+# Shared stamp that changes whenever a carousel image is added or removed.
+# Each worker compares it with the stamp its own copy was built under.
+_VERSION_KEY = 'carousel:version'
+
+# Seconds a worker keeps its slides even while the stamp is unchanged, so a
+# change the stamp missed (e.g. a per-process cache) shows up within this long
+SLIDES_MAX_AGE = 300
+
+_slides = None
+_slides_version = None
+_slides_built_at = 0.0
+
+
+def _variant_url(image, width):
+    # c_limit never upscales; f_auto/q_auto let Cloudinary pick WebP/AVIF and quality
+    return image.build_url(width=width, crop='limit', fetch_format='auto', quality='auto')
+
+
+def _build_slide(item):
+    slide = {'id': item.id, 'title': item.title, 'description': item.description}
+    variants = item.image_variants
+    if variants.get('status') == 'ready':
+        # Derivatives rendered locally by Mini_catalog.images
+        slide.update(url=variants['detail'], srcset='', sources=variants['sources'])
+    else:
+        slide.update(
+            url=item.imagee.url,
+            srcset=', '.join(f'{_variant_url(item.imagee, width)} {width}w' for width in CAROUSEL_WIDTHS),
+            sources=[],
+        )
+    return slide
+
+
+def _shared_version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def get_slides():
+    """
+    Return the homepage carousel as a list of dicts with the slide's id,
+    title, description, full-size url, a responsive srcset and any local
+    <picture> sources.
+
+    The list is built once per process and reused until a library change
+    moves the shared version stamp, or for at most SLIDES_MAX_AGE seconds,
+    so steady-state requests run no carousel queries and build no
+    Cloudinary URLs.
+    """
+    global _slides, _slides_version, _slides_built_at
+    version = _shared_version()
+    now = time.monotonic()
+    if _slides is None or _slides_version != version or now - _slides_built_at > SLIDES_MAX_AGE:
+        _slides = [_build_slide(item) for item in library.objects.order_by('id') if item.imagee]
+        _slides_version = version
+        _slides_built_at = now
+    return _slides
+
+
+def invalidate_slides(**kwargs):
+    """Make every worker rebuild its slides on its next request (used as a signal receiver)."""
+    global _slides
+    _slides = None
+    cache.set(_VERSION_KEY, time.time_ns(), None)
+
+
+def check_default_cache(app_configs, **kwargs):
+    """
+    System check: the carousel stamp and cart badge invalidation live in
+    the default cache, which only reaches every worker when it is shared.
+    """
+    if settings.WEB_CONCURRENCY > 1 and isinstance(caches['default'], LocMemCache):
+        return [checks.Warning(
+            f'The default cache is per process but WEB_CONCURRENCY is {settings.WEB_CONCURRENCY}.',
+            hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache, e.g. Redis. Until then other '
+                 f'workers can show a changed carousel for up to {SLIDES_MAX_AGE} seconds.',
+            id='Mini_catalog.W001',
+        )]
+    return []
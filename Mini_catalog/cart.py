@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Cart, CartItem
+
+# How long a user's cart badge numbers stay cached. Every cart mutation
+# invalidates them explicitly, so this only bounds staleness from price edits.
+CART_SUMMARY_TIMEOUT = 60 * 15
+
+
+def _summary_key(user_id):
+    return f'cart-summary:{user_id}'
+
+
+def get_cart_items(user):
+    """The user's cart lines with their products loaded in the same query."""
+    return CartItem.objects.filter(cart__user=user).select_related('product').order_by('id')
+
+
+def cart_totals(user):
+    """Return ``{'item_count': ..., 'total': ...}`` for the user's cart in one aggregate query."""
+    return CartItem.objects.filter(cart__user=user).aggregate(
+        item_count=Coalesce(Sum('quantity'), 0),
+        total=Coalesce(
+            Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def add_item(user, product_id, quantity=1):
+    """
+    Add ``quantity`` of a product to the user's cart as one upsert: the
+    line is inserted if missing and its quantity bumped in the database,
+    so concurrent adds of the same product all count and never create a
+    second line.
+    """
+    cart, _ = Cart.objects.get_or_create(user=user)
+    with transaction.atomic():
+        # The insert comes first so SQLite takes its write lock before anything is read
+        CartItem.objects.bulk_create([CartItem(cart=cart, product_id=product_id, quantity=0)], ignore_conflicts=True)
+        CartItem.objects.filter(cart=cart, product_id=product_id).update(quantity=F('quantity') + quantity)
+
+
+def change_quantity(user, item_id, delta):
+    """
+    Add ``delta`` (which may be negative) to one of the user's cart lines
+    in a single UPDATE that never takes the quantity below 1. Returns
+    False if the line does not exist or would drop below 1.
+    """
+    items = CartItem.objects.filter(id=item_id, cart__user=user)
+    if delta < 0:
+        items = items.filter(quantity__gt=-delta)
+    return bool(items.update(quantity=F('quantity') + delta))
+
+
+def get_cart_summary(user):
+    """Cached cart_totals() for the navigation badge."""
+    key = _summary_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = cart_totals(user)
+        cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate_cart_summary(user):
+    cache.delete(_summary_key(user.pk))
@@ -0,0 +1,21 @@
+from .models import Category
+
+# The only categories the shop sells under. They are created once by
+# migration 0015_bootstrap_categories instead of on every request.
+CATEGORY_NAMES = ['Luxury', 'Affordable']
+
+_categories = None
+
+
+def get_categories():
+    """Return the catalog categories, loading them from the database once per process."""
+    global _categories
+    if _categories is None:
+        _categories = list(Category.objects.filter(name__in=CATEGORY_NAMES).order_by('id'))
+    return _categories
+
+
+def clear_categories(**kwargs):
+    """Drop the in-process copy so the next read reloads it (used as a signal receiver)."""
+    global _categories
+    _categories = None
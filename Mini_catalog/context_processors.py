@@ -0,0 +1,9 @@
+from .cart import get_cart_summary
+
+
+def cart(request):
+    """Number of items in the user's cart for the badge in base.html."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated or user.is_staff:
+        return {'cart_items_count': 0}
+    return {'cart_items_count': get_cart_summary(user)['item_count']}
@@ -3,6 +3,17 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import Product, library
 
+def parse_price(price):
+    """Parse a price typed with optional thousands commas (e.g. "1,000"); shared with the bulk importer."""
+    # Remove commas and convert to float
+    try:
+        cleaned_price = float(str(price).replace(',', ''))
+        if cleaned_price < 0:
+            raise forms.ValidationError("Price cannot be negative.")
+        return cleaned_price
+    except ValueError:
+        raise forms.ValidationError("Enter a valid price (e.g., 1000 or 1,000).")
+
 class ProductForm(forms.ModelForm):
     price = forms.CharField(
         label='Price (₦)',
@@ -12,7 +23,7 @@ class ProductForm(forms.ModelForm):
 
     class Meta:
         model = Product
-        fields = ['category', 'name', 'description', 'price', 'in_stock', 'image', 'discount_percentage']
+        fields = ['category', 'name', 'description', 'price', 'stock', 'image', 'discount_percentage']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -21,15 +32,7 @@ class ProductForm(forms.ModelForm):
             self.fields['price'].initial = f"{self.instance.price:,.2f}"
 
     def clean_price(self):
-        price = self.cleaned_data['price']
-        # Remove commas and convert to float
-        try:
-            cleaned_price = float(price.replace(',', ''))
-            if cleaned_price < 0:
-                raise forms.ValidationError("Price cannot be negative.")
-            return cleaned_price
-        except ValueError:
-            raise forms.ValidationError("Enter a valid price (e.g., 1000 or 1,000).")
+        return parse_price(self.cleaned_data['price'])
 
 class AdminUserCreationForm(UserCreationForm):
     is_staff = forms.BooleanField(
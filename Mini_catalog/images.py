@@ -0,0 +1,204 @@
+import base64
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connection, transaction
+from django.db.models import F
+from PIL import Image, ImageFilter, ImageOps, features
+
+from .storage import ContentAddressedStorage
+
+logger = logging.getLogger(__name__)
+
+# Local copies of uploaded originals and their derivatives, one copy per
+# distinct file. The storage follows MEDIA_ROOT and MEDIA_URL.
+image_storage = ContentAddressedStorage(label='images')
+
+# Name -> width in pixels of each derivative. Images are never upscaled.
+DERIVATIVE_WIDTHS = {'thumb': 160, 'card': 400, 'detail': 1000}
+
+# Output formats, best first; formats this Pillow build cannot write are skipped
+DERIVATIVE_FORMATS = [
+    ('avif', 'image/avif', {'quality': 55, 'speed': 8}),
+    ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+]
+
+# Width of the blurred inline placeholder shown while the real image loads
+PLACEHOLDER_WIDTH = 16
+
+_executor = None
+
+
+def available_formats():
+    return [fmt for fmt in DERIVATIVE_FORMATS if features.check(fmt[0])]
+
+
+def _open(name):
+    with image_storage.open(name) as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _encode(image, fmt, options):
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _placeholder(image):
+    small = image.copy()
+    small.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    return 'data:image/webp;base64,' + base64.b64encode(_encode(small, 'webp', {'quality': 30})).decode()
+
+
+def render_derivatives(original, prefix):
+    """
+    Resize the stored image ``original`` to every DERIVATIVE_WIDTHS size in
+    every available format, save the results under ``prefix`` and return the
+    ready ``image_variants`` dict for the model.
+    """
+    image = _open(original)
+    formats = available_formats()
+    widths = sorted({min(width, image.width) for width in DERIVATIVE_WIDTHS.values()})
+    files = []
+    sources = {mime: [] for _, mime, _ in formats}
+    urls = {}
+    for width in widths:
+        resized = image if width == image.width else image.resize(
+            (width, max(1, round(image.height * width / image.width))), Image.LANCZOS,
+        )
+        for fmt, mime, options in formats:
+            name = image_storage.save(f'{prefix}/{width}w.{fmt}', ContentFile(_encode(resized, fmt, options)))
+            files.append(name)
+            url = image_storage.url(name)
+            sources[mime].append(f'{url} {width}w')
+            urls[(fmt, width)] = url
+
+    def url_for(size):
+        return urls[(formats[-1][0], min(DERIVATIVE_WIDTHS[size], image.width))]
+
+    card_width = min(DERIVATIVE_WIDTHS['card'], image.width)
+    return {
+        'status': 'ready',
+        'original': original,
+        'files': files,
+        # <source> entries for a <picture>, best format first
+        'sources': [{'type': mime, 'srcset': ', '.join(sources[mime])} for _, mime, _ in formats],
+        # The last format is the most widely supported fallback for <img>
+        'thumb': url_for('thumb'),
+        'card': url_for('card'),
+        'detail': url_for('detail'),
+        'width': card_width,
+        'height': max(1, round(image.height * card_width / image.width)),
+        'placeholder': _placeholder(image),
+    }
+
+
+def queue_derivatives(instance, upload, upload_field=None):
+    """
+    Keep a local copy of an image just uploaded for ``instance`` (a Product
+    or library item) and render its derivatives off the request thread once
+    the current transaction commits. With ``upload_field``, the name of a
+    CloudinaryField the form did not save, the original is sent to
+    Cloudinary in the background too, so the request never waits for it.
+    """
+    upload.seek(0)
+    model = type(instance)
+    # Stored under its content hash, so re-uploading the same file reuses it
+    original = image_storage.save(f'originals/{os.path.basename(upload.name)}', upload)
+    variants = {'status': 'pending', 'original': original}
+    if upload_field:
+        variants['upload_field'] = upload_field
+    model.objects.filter(pk=instance.pk).update(image_variants=variants)
+    transaction.on_commit(partial(submit, model._meta.label, instance.pk))
+    return original
+
+
+def run_in_background(func, *args):
+    """Run ``func(*args)`` on the image worker pool, or inline when IMAGE_PIPELINE_WORKERS is 0."""
+    global _executor
+    if not settings.IMAGE_PIPELINE_WORKERS:
+        return func(*args)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.IMAGE_PIPELINE_WORKERS, thread_name_prefix='image-pipeline')
+    return _executor.submit(_run_in_worker, func, *args)
+
+
+def _run_in_worker(func, *args):
+    try:
+        return func(*args)
+    except Exception:
+        logger.exception('Background image task %s%r failed', func.__name__, args)
+        raise
+    finally:
+        # Each pool thread has its own database connection
+        connection.close()
+
+
+def submit(model_label, pk):
+    """Render the derivatives of one pending image in the background."""
+    return run_in_background(process_image, model_label, pk)
+
+
+def _upload_original(item, field_name, original):
+    """Send the local copy of ``original`` to Cloudinary and return the value to store in ``field_name``."""
+    field = item._meta.get_field(field_name)
+    with image_storage.open(original) as f:
+        # CloudinaryField uploads an UploadedFile when the row is saved
+        setattr(item, field.attname, UploadedFile(f, name=os.path.basename(original)))
+        return field.pre_save(item, add=False)
+
+
+def process_image(model_label, pk):
+    """
+    Render the derivatives for one pending image, upload the original to
+    Cloudinary if the request left that to us, and store the results on
+    the row. Returns True when the row was updated.
+    """
+    from .carousel import invalidate_slides
+    from .pagecache import purge_pages
+
+    model = apps.get_model(model_label)
+    item = model.objects.filter(pk=pk).only('image_variants').first()
+    if item is None or item.image_variants.get('status') not in ('pending', 'failed'):
+        return False
+    original = item.image_variants['original']
+    upload_field = item.image_variants.get('upload_field')
+    prefix = os.path.splitext(original.replace('originals/', 'derivatives/', 1))[0]
+
+    changes = {}
+    try:
+        variants = render_derivatives(original, prefix)
+        if upload_field:
+            changes[upload_field] = _upload_original(item, upload_field, original)
+    except Exception as e:
+        logger.warning('Could not process %s: %s', original, e)
+        failed = {'status': 'failed', 'original': original, 'error': str(e)}
+        if upload_field:
+            # Kept so a retry uploads it too
+            failed['upload_field'] = upload_field
+        model.objects.filter(pk=pk, image_variants__original=original).update(image_variants=failed)
+        return False
+
+    changes['image_variants'] = variants
+    if any(field.name == 'version' for field in model._meta.fields):
+        # Cached product cards are keyed on the version
+        changes['version'] = F('version') + 1
+    # A newer upload may have replaced this original while it was processed
+    updated = model.objects.filter(pk=pk, image_variants__original=original).update(**changes)
+    if updated:
+        if model._meta.model_name == 'library':
+            invalidate_slides()
+        purge_pages()
+    return bool(updated)
@@ -0,0 +1,42 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from Mini_catalog.analytics import rebuild_rollups
+from Mini_catalog.models import Order
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups behind the admin dashboard from order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD); defaults to the first order')
+        parser.add_argument('--until', help='Last day to rebuild (YYYY-MM-DD); defaults to today')
+        parser.add_argument('--batch-days', type=int, default=31, help='Days rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            since = date.fromisoformat(options['since']) if options['since'] else None
+            until = date.fromisoformat(options['until']) if options['until'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+        if since is None:
+            first = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            if first is None:
+                self.stdout.write('No orders to backfill.')
+                return
+            since = timezone.localdate(first)
+
+        total_days = total_products = 0
+        start = since
+        while start <= until:
+            end = min(start + timedelta(days=options['batch_days'] - 1), until)
+            with transaction.atomic():
+                days, products = rebuild_rollups(start, end)
+            total_days += days
+            total_products += products
+            self.stdout.write(f'{start} to {end}: {days} days with sales activity, {products} product rows')
+            start = end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rollups from {since} to {until}: {total_days} days, {total_products} product rows'
+        ))
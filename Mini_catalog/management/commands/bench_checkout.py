@@ -0,0 +1,111 @@
+import statistics
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+
+from Mini_catalog.models import Cart, CartItem, Order, OrderItem, Product
+from Mini_catalog.orders import CheckoutError, place_order
+
+PREFIX = 'bench-checkout'
+
+
+class Command(BaseCommand):
+    help = (
+        'Place orders for many buyers at once and report throughput, latency and '
+        'stock consistency. Writes bench users, products and orders (and sales '
+        'rollups), so point it at a scratch database, e.g. DB_NAME=bench.sqlite3'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200, help='Buyers checking out')
+        parser.add_argument('--threads', type=int, default=16, help='Buyers checking out at the same time')
+        parser.add_argument('--lines', type=int, default=50, help='Products in each cart')
+        parser.add_argument('--quantity', type=int, default=2, help='Units of each product in a cart')
+        parser.add_argument(
+            '--stock', type=int,
+            help='Units of each product in stock (default: enough for every buyer). '
+                 'Use --buyers 1000 --lines 1 --quantity 1 --stock 100 for a flash sale',
+        )
+        parser.add_argument('--double-submit', action='store_true', help='Submit every checkout twice with the same token')
+        parser.add_argument('--keep', action='store_true', help='Leave the bench users, products and orders in place')
+        parser.add_argument('--force', action='store_true', help='Run even when DEBUG is off')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Refusing to write bench data with DEBUG off; pass --force to run anyway.')
+        buyers, lines, quantity = options['buyers'], options['lines'], options['quantity']
+        stock = options['stock'] if options['stock'] is not None else buyers * quantity
+        run = uuid.uuid4().hex[:8]
+
+        products = Product.objects.bulk_create([
+            Product(name=f'{PREFIX}-{run}-{i}', description='', price=10, stock=stock)
+            for i in range(lines)
+        ])
+        users = User.objects.bulk_create([User(username=f'{PREFIX}-{run}-{i}') for i in range(buyers)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=quantity) for cart in carts for product in products
+        ], batch_size=500)
+
+        def checkout(user):
+            token = uuid.uuid4()
+            outcomes = []
+            try:
+                for _ in range(2 if options['double_submit'] else 1):
+                    started = time.perf_counter()
+                    try:
+                        place_order(user, 'Bench address', None, token)
+                        outcomes.append((time.perf_counter() - started, None))
+                    except CheckoutError:
+                        outcomes.append((time.perf_counter() - started, 'short of stock'))
+                    except Exception as e:
+                        outcomes.append((time.perf_counter() - started, type(e).__name__))
+            finally:
+                connection.close()
+            return outcomes
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['threads']) as pool:
+                outcomes = [outcome for result in pool.map(checkout, users) for outcome in result]
+            wall = time.perf_counter() - started
+            self.report(outcomes, wall, users, products, stock)
+        finally:
+            if not options['keep']:
+                Order.objects.filter(user__in=users).delete()
+                User.objects.filter(pk__in=[user.pk for user in users]).delete()
+                Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+
+    def report(self, outcomes, wall, users, products, stock):
+        latencies = sorted(seconds * 1000 for seconds, _ in outcomes)
+        errors = Counter(error for _, error in outcomes if error)
+        orders = Order.objects.filter(user__in=users)
+        partial = orders.annotate(lines=Count('items')).filter(lines__lt=len(products)).count()
+        duplicates = orders.values('user').annotate(n=Count('id')).filter(n__gt=1).count()
+        sold = OrderItem.objects.filter(order__in=orders).values('product').annotate(units=Sum('quantity'))
+        left = dict(Product.objects.filter(pk__in=[product.pk for product in products]).values_list('pk', 'stock'))
+        oversold = sum(1 for row in sold if row['units'] > stock or left[row['product']] != stock - row['units'])
+
+        self.stdout.write(f'{len(outcomes)} checkouts in {wall:.2f}s ({len(outcomes) / wall:,.1f}/s)')
+        self.stdout.write(
+            f'latency p50 {statistics.median(latencies):.1f}ms, '
+            f'p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:.1f}ms'
+        )
+        for error, count in errors.most_common():
+            self.stdout.write(f'{count} {error}')
+        self.stdout.write(
+            f'{orders.count()} orders, {partial} partial, {duplicates} buyers with duplicate orders, '
+            f'{oversold} products oversold or miscounted, '
+            f'{CartItem.objects.filter(cart__user__in=users).values("cart").distinct().count()} carts left'
+        )
+        if partial or duplicates or oversold or set(errors) - {'short of stock'}:
+            self.stdout.write(self.style.ERROR('Checkout left inconsistent data'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Stock, orders and carts are consistent'))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from Mini_catalog.sessions import SESSION_CLEANUP_CHUNK_SIZE, clear_expired_sessions, session_model
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions from the database in batches, a short transaction each'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=SESSION_CLEANUP_CHUNK_SIZE,
+                            help='Sessions deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Count the expired sessions without deleting them')
+
+    def handle(self, *args, **options):
+        if session_model() is None:
+            self.stdout.write(f'{settings.SESSION_ENGINE} does not keep sessions in the database; nothing to clear')
+            return
+        started = time.perf_counter()
+
+        def progress(deleted):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{deleted} sessions deleted ({deleted / elapsed:,.0f} sessions/s)')
+
+        deleted = clear_expired_sessions(
+            chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} expired sessions in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,46 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from Mini_catalog.notifications import claim_due, deliver_batch
+
+class Command(BaseCommand):
+    help = 'Deliver queued email and inbox notifications from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of delivery threads')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_BATCH_SIZE,
+                            help='Notifications per batch (one mail connection each)')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when the outbox is empty')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        batch_size = options['batch_size']
+
+        with ThreadPoolExecutor(workers) as pool:
+            while True:
+                ids = claim_due(batch_size * workers)
+                if ids:
+                    batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+                    sent = failed = 0
+                    for batch_sent, batch_failed in pool.map(self._deliver, batches):
+                        sent += batch_sent
+                        failed += batch_failed
+                    self.stdout.write(
+                        self.style.SUCCESS(f'Delivered {sent} notifications') +
+                        (self.style.WARNING(f', {failed} failed and will be retried') if failed else '')
+                    )
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+    def _deliver(self, ids):
+        try:
+            return deliver_batch(ids)
+        finally:
+            # Each pool thread has its own database connection
+            connection.close()
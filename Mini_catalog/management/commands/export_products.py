@@ -0,0 +1,36 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from Mini_catalog.product_io import PRODUCT_FORMATS, export_rows, serialize_rows
+
+class Command(BaseCommand):
+    help = 'Write every product to a CSV or JSONL file, streaming rows from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write, or - for standard output')
+        parser.add_argument('--format', choices=PRODUCT_FORMATS, help='Defaults to the file extension')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in PRODUCT_FORMATS:
+            raise CommandError('Pass --format csv or --format jsonl')
+
+        started = time.perf_counter()
+        lines = 0
+        stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            for line in serialize_rows(export_rows(), fmt):
+                stream.write(line)
+                lines += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        # The CSV header line is not a product
+        rows = lines - 1 if fmt == 'csv' else lines
+        seconds = time.perf_counter() - started
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {rows} products in {seconds:.1f}s ({rows / seconds if seconds else 0:,.0f} rows/s)'
+        ))
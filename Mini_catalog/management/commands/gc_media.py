@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from Mini_catalog.images import image_storage
+from Mini_catalog.models import proof_storage
+from Mini_catalog.storage import adopt_proofs, collect_garbage
+
+class Command(BaseCommand):
+    help = 'Recount references to stored media, delete unreferenced files and report the space deduplication saves'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=3600,
+                            help='Seconds a newly stored file is kept even if nothing refers to it yet')
+        parser.add_argument('--adopt', action='store_true',
+                            help='First move proofs saved before content addressing into the store')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without changing it')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['adopt']:
+            adopted = adopt_proofs(proof_storage, dry_run=dry_run)
+            self.stdout.write(
+                f"Adopted {adopted['adopted']} legacy proofs ({filesizeformat(adopted['adopted_bytes'])}), "
+                f"{filesizeformat(adopted['freed_bytes'])} of duplicates freed"
+            )
+
+        stats = collect_garbage([proof_storage, image_storage], grace=timedelta(seconds=options['grace']), dry_run=dry_run)
+        self.stdout.write(
+            f"{stats['blobs']} stored files, {filesizeformat(stats['stored_bytes'])} referenced; "
+            f"{stats['recounted']} refcounts corrected"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would remove' if dry_run else 'Removed'} {stats['removed']} unreferenced files "
+            f"({filesizeformat(stats['removed_bytes'])}); deduplication saves {filesizeformat(stats['saved_bytes'])} "
+            f"({stats['saved_bytes']} bytes)"
+        ))
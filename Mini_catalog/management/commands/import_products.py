@@ -0,0 +1,39 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from Mini_catalog.product_io import IMPORT_CHUNK_SIZE, PRODUCT_FORMATS, import_products, read_rows
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSONL file, streaming it in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for standard input")
+        parser.add_argument('--format', choices=PRODUCT_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Rows written per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in PRODUCT_FORMATS:
+            raise CommandError('Pass --format csv or --format jsonl')
+
+        if path == '-':
+            report = import_products(read_rows(sys.stdin, fmt), options['chunk_size'], options['dry_run'])
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8-sig') as stream:
+                    report = import_products(read_rows(stream, fmt), options['chunk_size'], options['dry_run'])
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for line, message in report.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        if report.error_count > len(report.errors):
+            self.stderr.write(f'... and {report.error_count - len(report.errors)} more errors')
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {report.rows} rows in {report.seconds:.1f}s ({report.rows_per_second:,.0f} rows/s): '
+            f'{report.created} created, {report.updated} updated, {report.error_count} rejected'
+        ))
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from Mini_catalog.images import process_image
+from Mini_catalog.models import Product, library
+
+class Command(BaseCommand):
+    help = 'Render image derivatives left pending, e.g. by a restart before the background pool finished'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of rendering threads')
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry images whose last render failed')
+
+    def handle(self, *args, **options):
+        statuses = ['pending', 'failed'] if options['retry_failed'] else ['pending']
+        jobs = [
+            (model._meta.label, pk)
+            for model in (Product, library)
+            for pk in model.objects.filter(image_variants__status__in=statuses).values_list('pk', flat=True)
+        ]
+        if not jobs:
+            self.stdout.write('No images to process.')
+            return
+
+        with ThreadPoolExecutor(options['workers']) as pool:
+            done = sum(pool.map(self._process, jobs))
+        self.stdout.write(self.style.SUCCESS(f'Rendered derivatives for {done} of {len(jobs)} images'))
+
+    def _process(self, job):
+        try:
+            return process_image(*job)
+        finally:
+            # Each pool thread has its own database connection
+            connection.close()
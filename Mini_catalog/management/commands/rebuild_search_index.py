@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from Mini_catalog.search import rebuild_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from the Product table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        total = rebuild_index(using=options['database'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {total} products for search')
+        )
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Mini_catalog.ratings import RATING_CHUNK_SIZE, demo_ratings, recompute_ratings
+
+class Command(BaseCommand):
+    help = 'Give every product a random demo rating, writing ratings in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, help='Seed for the random ratings, for repeatable runs')
+        parser.add_argument('--chunk-size', type=int, default=RATING_CHUNK_SIZE, help='Products written per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Count the products that would change without writing')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{stats['products']} products checked, {stats['changed']} changed "
+                f"({stats['products'] / elapsed:,.0f} products/s)"
+            )
+
+        stats = recompute_ratings(
+            demo_ratings(options['seed']), chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'], progress=progress if options['verbosity'] > 0 else None,
+        )
+        verb = 'Would update' if options['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} ratings of {stats['changed']} of {stats['products']} products "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+CATEGORY_NAMES = ['Luxury', 'Affordable']
+
+
+def bootstrap_categories(apps, schema_editor):
+    Category = apps.get_model('Mini_catalog', 'Category')
+    db = schema_editor.connection.alias
+    for name in CATEGORY_NAMES:
+        Category.objects.using(db).get_or_create(name=name)
+    # Remove any unwanted categories
+    Category.objects.using(db).exclude(name__in=CATEGORY_NAMES).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Mini_catalog', '0014_product_num_ratings_product_rating'),
+    ]
+
+    operations = [
+        migrations.RunPython(bootstrap_categories, migrations.RunPython.noop),
+    ]
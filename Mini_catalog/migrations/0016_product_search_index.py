@@ -0,0 +1,41 @@
+from django.db import migrations
+
+FTS_TABLE = 'Mini_catalog_product_fts'
+GIN_INDEX = 'product_search_gin'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+            f'SELECT id, name, description FROM Mini_catalog_product'
+        )
+    elif connection.vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from Mini_catalog.search import search_vector
+
+        Product = apps.get_model('Mini_catalog', 'Product')
+        schema_editor.add_index(Product, GinIndex(search_vector(), name=GIN_INDEX))
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {GIN_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Mini_catalog', '0015_bootstrap_categories'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Mini_catalog', '0017_product_discount_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='order_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedorder',
+            index=models.Index(fields=['completed_at'], name='completedorder_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rejectedorder',
+            index=models.Index(fields=['rejected_at'], name='rejectedorder_rejected_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxmessage',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='inbox_user_read_created_idx'),
+        ),
+    ]
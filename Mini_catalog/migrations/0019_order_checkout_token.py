@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Mini_catalog', '0018_catalog_order_inbox_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='checkout_token',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
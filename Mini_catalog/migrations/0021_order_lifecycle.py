@@ -0,0 +1,123 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fold_archived_orders(apps, schema_editor):
+    """Move CompletedOrder and RejectedOrder rows back into Order under their original ids."""
+    Order = apps.get_model('Mini_catalog', 'Order')
+    OrderStatusChange = apps.get_model('Mini_catalog', 'OrderStatusChange')
+    CompletedOrder = apps.get_model('Mini_catalog', 'CompletedOrder')
+    RejectedOrder = apps.get_model('Mini_catalog', 'RejectedOrder')
+    db = schema_editor.connection.alias
+
+    archived = []
+    for row in CompletedOrder.objects.using(db).iterator():
+        archived.append((row, Order(
+            status='completed', completed_at=row.completed_at,
+            user_id=row.user_id, total_amount=row.total_amount,
+            delivery_address=row.delivery_address, proof_of_payment=row.proof_of_payment,
+        ), 'approved'))
+    for row in RejectedOrder.objects.using(db).iterator():
+        archived.append((row, Order(
+            status='rejected', rejected_at=row.rejected_at, rejection_reason=row.rejection_reason,
+            user_id=row.user_id, total_amount=row.total_amount,
+            delivery_address=row.delivery_address, proof_of_payment=row.proof_of_payment,
+        ), 'pending'))
+    if not archived:
+        return
+
+    taken = set(Order.objects.using(db).values_list('id', flat=True))
+    for row, order, _ in archived:
+        # Archived ids were freed by the delete, so they are normally still available
+        if row.original_order_id not in taken:
+            order.id = row.original_order_id
+            taken.add(order.id)
+    Order.objects.using(db).bulk_create([order for _, order, _ in archived if order.id is not None], batch_size=500)
+    for _, order, _ in archived:
+        if order.id is None:
+            order.save(using=db)
+    orders = [order for _, order, _ in archived]
+
+    # created_at is auto_now_add, so the original value is restored with an UPDATE
+    for (row, _, _), order in zip(archived, orders):
+        order.created_at = row.created_at
+    Order.objects.using(db).bulk_update(orders, ['created_at'], batch_size=500)
+
+    OrderStatusChange.objects.using(db).bulk_create([
+        OrderStatusChange(
+            order_id=order.id, from_status=from_status, to_status=order.status,
+            changed_at=order.completed_at or order.rejected_at, note='Restored from the order archive',
+        )
+        for (_, _, from_status), order in zip(archived, orders)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Mini_catalog', '0020_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='approved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='rejected_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='rejection_reason',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_status_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'approved'])), fields=['created_at'], name='order_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['completed_at'], name='order_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'rejected')), fields=['rejected_at'], name='order_rejected_idx'),
+        ),
+        migrations.CreateModel(
+            name='OrderStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('pending', 'Pending Approval'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('completed', 'Completed')], max_length=20)),
+                ('to_status', models.CharField(choices=[('pending', 'Pending Approval'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('completed', 'Completed')], max_length=20)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('note', models.TextField(blank=True)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_changes', to='Mini_catalog.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'changed_at'], name='orderstatus_order_changed_idx')],
+            },
+        ),
+        migrations.RunPython(fold_archived_orders, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='CompletedOrder',
+        ),
+        migrations.DeleteModel(
+            name='RejectedOrder',
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def user_indexes():
+    # auth.User has no Meta of ours to declare these on
+    return [
+        # The admin dashboard's user search matches lower-cased username and email prefixes
+        models.Index(Lower('username'), name='auth_user_username_lower_idx'),
+        models.Index(Lower('email'), name='auth_user_email_lower_idx'),
+        # Staff and inactive accounts are rare, so their filters page through small partial indexes
+        models.Index(fields=['id'], condition=models.Q(is_staff=True), name='auth_user_staff_idx'),
+        models.Index(fields=['id'], condition=models.Q(is_active=False), name='auth_user_inactive_idx'),
+    ]
+
+
+def create_user_indexes(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    for index in user_indexes():
+        schema_editor.add_index(User, index)
+
+
+def drop_user_indexes(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    for index in user_indexes():
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('Mini_catalog', '0025_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_user_indexes, drop_user_indexes),
+    ]
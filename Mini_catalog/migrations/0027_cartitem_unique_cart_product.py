@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Fold repeated (cart, product) lines into the oldest one, adding up their quantities."""
+    CartItem = apps.get_model('Mini_catalog', 'CartItem')
+    db = schema_editor.connection.alias
+    duplicates = (
+        CartItem.objects.using(db).values('cart_id', 'product_id')
+        .annotate(lines=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        CartItem.objects.using(db).filter(id=row['keep']).update(quantity=row['total'])
+        CartItem.objects.using(db).filter(cart_id=row['cart_id'], product_id=row['product_id']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Mini_catalog', '0026_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cartitem_cart_product_uniq'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+# Units given to products that were marked in stock, which had no count
+# before. Staff should replace it with real counts.
+LEGACY_IN_STOCK_UNITS = 100
+
+
+def stock_from_flag(apps, schema_editor):
+    Product = apps.get_model('Mini_catalog', 'Product')
+    db = schema_editor.connection.alias
+    Product.objects.using(db).filter(in_stock=True).update(stock=LEGACY_IN_STOCK_UNITS)
+
+
+def flag_from_stock(apps, schema_editor):
+    Product = apps.get_model('Mini_catalog', 'Product')
+    db = schema_editor.connection.alias
+    Product.objects.using(db).filter(stock__gt=0).update(in_stock=True)
+    Product.objects.using(db).filter(stock=0).update(in_stock=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Mini_catalog', '0027_cartitem_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(stock_from_flag, flag_from_stock),
+        migrations.RemoveField(
+            model_name='product',
+            name='in_stock',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='stock_reserved',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
 from django.contrib.auth.models import User
-from django.core.files.storage import default_storage, FileSystemStorage
+from django.core.files.storage import default_storage
+from .storage import ContentAddressedStorage
 
 class library(models.Model):
 
@@ -10,9 +12,11 @@ class library(models.Model):
     description = models.CharField(max_length=255)
 
     imagee = CloudinaryField('image')
+    # Locally rendered sizes and formats, filled in by Mini_catalog.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
-# Custom storage for proof of payment files (local storage)
-proof_storage = FileSystemStorage(location='media')
+# Custom storage for proof of payment files (local storage, one copy per distinct file)
+proof_storage = ContentAddressedStorage(location='media', label='proofs')
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -25,15 +29,40 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)  # e.g., 20.00 for 20%
-    in_stock = models.BooleanField(default=True)
+    # Units left to sell. Checkouts reserve units with a conditional UPDATE (Mini_catalog.stock)
+    stock = models.PositiveIntegerField(default=0)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)  # allow nulls
     image = CloudinaryField('image', blank=True, null=True)
+    # Locally rendered sizes and formats, filled in by Mini_catalog.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0, help_text="Average rating out of 5")
     num_ratings = models.PositiveIntegerField(default=0)
+    # Bumped on every save; cached product card fragments are keyed on it
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Homepage discount sections read the biggest discounts first
+            models.Index(fields=['discount_percentage', 'id'], name='product_discount_idx'),
+            # Price range filters and the BOGO section
+            models.Index(fields=['price'], name='product_price_idx'),
+            # Category filter combined with a price range
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.version += 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+
+    @property
+    def in_stock(self):
+        return self.stock > 0
+
     @property
     def discounted_price(self):
         if self.discount_percentage > 0:
@@ -57,6 +86,12 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # One line per product: Mini_catalog.cart upserts into it instead of adding rows
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartitem_cart_product_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
@@ -64,6 +99,10 @@ class CartItem(models.Model):
         return self.product.price * self.quantity
 
 # New models for orders
+# Orders staff still have to act on. Queries must filter on exactly this
+# list for the database to use the order_active_created_idx partial index.
+ACTIVE_ORDER_STATUSES = ['pending', 'approved']
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending Approval'),
@@ -71,13 +110,41 @@ class Order(models.Model):
         ('rejected', 'Rejected'),
         ('completed', 'Completed'),
     ]
+    ACTIVE_STATUSES = ACTIVE_ORDER_STATUSES
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    approved_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    rejected_at = models.DateTimeField(blank=True, null=True)
+    rejection_reason = models.TextField(blank=True, null=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     delivery_address = models.TextField(blank=True, null=True)
     proof_of_payment = models.ImageField(storage=proof_storage, upload_to='', blank=True, null=True)
+    checkout_token = models.UUIDField(unique=True, null=True, blank=True, editable=False)  # Guards against double submits
+    # Set when checkout takes the order's units out of stock, cleared when rejecting puts them back
+    stock_reserved = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            # Staff order queue in order_management; only covers active orders
+            models.Index(
+                fields=['created_at'], name='order_active_created_idx',
+                condition=models.Q(status__in=ACTIVE_ORDER_STATUSES),
+            ),
+            # A customer's orders in order_history
+            models.Index(fields=['user', 'status', 'created_at'], name='order_user_status_idx'),
+            # Order history in completed_orders and rejected_orders
+            models.Index(
+                fields=['completed_at'], name='order_completed_idx',
+                condition=models.Q(status='completed'),
+            ),
+            models.Index(
+                fields=['rejected_at'], name='order_rejected_idx',
+                condition=models.Q(status='rejected'),
+            ),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
@@ -97,31 +164,22 @@ class OrderItem(models.Model):
     def total_price(self):
         return self.price * self.quantity
 
-# Models for archiving completed and rejected orders
-class CompletedOrder(models.Model):
-    original_order_id = models.IntegerField()
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField()
-    completed_at = models.DateTimeField(auto_now_add=True)
-    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    delivery_address = models.TextField()
-    proof_of_payment = models.ImageField(storage=proof_storage, upload_to='', blank=True, null=True)
-
-    def __str__(self):
-        return f"Completed Order {self.original_order_id} by {self.user.username}"
+# Every status change an order goes through, written by moderate_orders
+class OrderStatusChange(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_changes')
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    changed_at = models.DateTimeField(default=timezone.now)
+    note = models.TextField(blank=True)
 
-class RejectedOrder(models.Model):
-    original_order_id = models.IntegerField()
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField()
-    rejected_at = models.DateTimeField(auto_now_add=True)
-    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    delivery_address = models.TextField(blank=True, null=True)
-    proof_of_payment = models.ImageField(storage=proof_storage, upload_to='', blank=True, null=True)
-    rejection_reason = models.TextField(blank=True, null=True)
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'changed_at'], name='orderstatus_order_changed_idx'),
+        ]
 
     def __str__(self):
-        return f"Rejected Order {self.original_order_id} by {self.user.username}"
+        return f"Order {self.order_id}: {self.from_status} -> {self.to_status}"
 
 # New model for contact messages
 class ContactMessage(models.Model):
@@ -149,6 +207,10 @@ class InboxMessage(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's inbox and its unread count
+            models.Index(fields=['user', 'is_read', 'created_at'], name='inbox_user_read_created_idx'),
+        ]
 
 class Wishlist(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -164,3 +226,92 @@ class WishlistItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} in {self.wishlist.user.username}'s wishlist"
+
+# Outbox of notifications waiting to be delivered by the deliver_notifications
+# command, written in the same transaction as the change they announce
+class Notification(models.Model):
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('inbox', 'Inbox message'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    subject = models.CharField(max_length=200)
+    message = models.TextField()
+    message_type = models.CharField(max_length=50, default='general')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # The worker polls for pending notifications that are due
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} to {self.user.username}: {self.subject}"
+
+class MediaBlob(models.Model):
+    """A file kept once by a ContentAddressedStorage, keyed on the SHA-256 of the bytes uploaded."""
+    storage = models.CharField(max_length=20)
+    sha256 = models.CharField(max_length=64)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Rows referring to the file; kept up to date on save and delete, and recounted by gc_media
+    refcount = models.PositiveIntegerField(default=0)
+    last_stored_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['storage', 'sha256'], name='mediablob_storage_sha256_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['storage', 'name'], name='mediablob_storage_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.storage}:{self.name} ({self.refcount} refs)"
+
+# Daily rollups maintained by Mini_catalog.analytics as orders change status.
+# The admin dashboard reads only these, never Order or OrderItem.
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders_placed = models.PositiveIntegerField(default=0)
+    placed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders_approved = models.PositiveIntegerField(default=0)
+    orders_rejected = models.PositiveIntegerField(default=0)
+    orders_completed = models.PositiveIntegerField(default=0)
+    # Revenue is recognised when an order is completed
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.orders_completed} orders, {self.revenue}"
+
+    @property
+    def average_order_value(self):
+        return self.revenue / self.orders_completed if self.orders_completed else 0
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='dailyproductsales_date_product_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.units} x {self.product_id}"
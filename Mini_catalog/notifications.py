@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import InboxMessage, Notification
+
+# How long a claimed notification is reserved for one worker. If the worker
+# dies before recording the outcome, the row becomes due again afterwards.
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def queue_orders_approved(orders):
+    """Queue the inbox messages and emails announcing approved orders, in one insert."""
+    delivery_date = timezone.now() + timedelta(days=3)
+    notifications = []
+    for order in orders:
+        username = order.user.username
+        notifications.append(Notification(
+            user=order.user,
+            channel='inbox',
+            message_type='order_update',
+            subject=f"Order #{order.id} Approved - Delivery Scheduled",
+            message=f"Hello {username},\n\nYour order #{order.id} has been approved! Your package will be delivered within 3 days (by {delivery_date.strftime('%B %d, %Y')}).\n\nDelivery Address:\n{order.delivery_address}\n\nThank you for shopping with us!",
+        ))
+        if order.user.email:
+            notifications.append(Notification(
+                user=order.user,
+                channel='email',
+                message_type='order_update',
+                subject=f"Your Order #{order.id} has been Approved",
+                message=f"Hello {username},\n\nYour order #{order.id} has been approved. Please wait for delivery at the following address:\n\n{order.delivery_address}\n\nThank you for shopping with us!",
+            ))
+    return Notification.objects.bulk_create(notifications)
+
+
+def claim_due(limit):
+    """
+    Reserve up to ``limit`` due notifications for this worker and return
+    their ids. Rows locked by another worker are skipped where the database
+    supports it.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = Notification.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+        ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+        Notification.objects.filter(id__in=ids).update(next_attempt_at=now + CLAIM_LEASE)
+    return ids
+
+
+def _retry_delay(attempts):
+    # Exponential backoff: base, 2 x base, 4 x base, ...
+    return timedelta(seconds=settings.NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def _record_failure(notification, error):
+    notification.attempts += 1
+    notification.last_error = str(error)
+    if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+        notification.status = 'failed'
+    else:
+        notification.next_attempt_at = timezone.now() + _retry_delay(notification.attempts)
+
+
+def deliver_batch(ids):
+    """
+    Deliver the claimed notifications in ``ids``. Inbox messages are written
+    with one bulk insert and all emails go through a single mail connection.
+    Returns ``(sent, failed)`` counts.
+    """
+    notifications = list(Notification.objects.filter(id__in=ids, status='pending').select_related('user'))
+    inbox = [notification for notification in notifications if notification.channel == 'inbox']
+    emails = [notification for notification in notifications if notification.channel == 'email']
+    now = timezone.now()
+    sent = failed = 0
+
+    if inbox:
+        with transaction.atomic():
+            InboxMessage.objects.bulk_create([
+                InboxMessage(
+                    user=notification.user,
+                    subject=notification.subject,
+                    message=notification.message,
+                    message_type=notification.message_type,
+                )
+                for notification in inbox
+            ])
+            Notification.objects.filter(id__in=[notification.id for notification in inbox]).update(
+                status='sent', sent_at=now, attempts=F('attempts') + 1,
+            )
+        sent += len(inbox)
+
+    if emails:
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            # Could not reach the mail server at all; retry the whole batch later
+            for notification in emails:
+                _record_failure(notification, e)
+            failed += len(emails)
+        else:
+            try:
+                for notification in emails:
+                    message = EmailMessage(
+                        notification.subject, notification.message, settings.DEFAULT_FROM_EMAIL,
+                        [notification.user.email], connection=connection,
+                    )
+                    try:
+                        message.send()
+                    except Exception as e:
+                        _record_failure(notification, e)
+                        failed += 1
+                    else:
+                        notification.attempts += 1
+                        notification.status = 'sent'
+                        notification.sent_at = timezone.now()
+                        sent += 1
+            finally:
+                connection.close()
+        Notification.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+
+    return sent, failed
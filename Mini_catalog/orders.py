@@ -0,0 +1,166 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics import record_order_placed, record_transition
+from .cart import invalidate_cart_summary
+from .models import Cart, CartItem, Order, OrderItem, OrderStatusChange, Product
+from .notifications import queue_orders_approved
+from .stock import release_stock, reserve_stock
+from .uploads import store_proof
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class _Shortfall(Exception):
+    """Raised inside the checkout transaction with the ids of products short of stock."""
+
+
+def _short_stock_message(names):
+    return f"Not enough stock left for: {', '.join(sorted(names))}. Please update your cart."
+
+
+def place_order(user, delivery_address, proof_of_payment, checkout_token):
+    """
+    Turn the user's cart into a pending order as one atomic unit of work.
+
+    The cart row is locked, each line's units are reserved from stock, the
+    order lines are written with a single bulk insert and the cart is
+    emptied, all in one transaction. If any product is short of stock,
+    CheckoutError is raised and nothing is reserved. ``checkout_token``
+    comes from the checkout form, so a double submit returns the order the
+    first submit created instead of creating a second one. The proof of
+    payment is stored under its content hash, so orders paid with the same
+    image share one file.
+    """
+    existing = Order.objects.filter(user=user, checkout_token=checkout_token).first()
+    if existing:
+        return existing
+
+    # Once a flash sale sells out, buyers fail here on a plain read instead of
+    # queueing for the write lock; the reservation below still has the final say
+    short = CartItem.objects.filter(cart__user=user, quantity__gt=F('product__stock'))
+    if short.exists():
+        raise CheckoutError(_short_stock_message(short.values_list('product__name', flat=True)))
+
+    try:
+        with transaction.atomic():
+            # Lock the cart row. SQLite has no row locks and ignores FOR UPDATE,
+            # so the no-op UPDATE first takes its write lock up front rather than
+            # upgrading a read lock halfway through, which fails under contention.
+            Cart.objects.filter(user=user).update(user=user)
+            lines = list(CartItem.objects.filter(cart__user=user).values_list('product_id', 'quantity', 'product__price'))
+            if not lines:
+                # A concurrent submit with the same token may have just emptied the cart
+                existing = Order.objects.filter(user=user, checkout_token=checkout_token).first()
+                if existing:
+                    return existing
+                raise CheckoutError('Your cart is empty. Add items before checking out.')
+            # Reserving straight after the read keeps buyers who lost the race to the
+            # last units to a few statements under the write lock
+            short = reserve_stock({product_id: quantity for product_id, quantity, _ in lines})
+            if short:
+                # Rolls back the units already reserved for the other lines
+                raise _Shortfall(short)
+
+            order = Order.objects.create(
+                user=user,
+                status='pending',
+                total_amount=sum(price * quantity for _, quantity, price in lines),
+                delivery_address=delivery_address,
+                proof_of_payment=store_proof(proof_of_payment) if proof_of_payment else None,
+                checkout_token=checkout_token,
+                stock_reserved=True,
+            )
+            OrderItem.objects.bulk_create([
+                # Store the price at the time of the order
+                OrderItem(order=order, product_id=product_id, quantity=quantity, price=price)
+                for product_id, quantity, price in lines
+            ])
+            CartItem.objects.filter(cart__user=user).delete()
+            record_order_placed(order)
+    except _Shortfall as e:
+        raise CheckoutError(_short_stock_message(Product.objects.filter(pk__in=e.args[0]).values_list('name', flat=True)))
+    except IntegrityError:
+        # A concurrent submit with the same token won the race
+        existing = Order.objects.filter(user=user, checkout_token=checkout_token).first()
+        if existing is None:
+            raise
+        return existing
+
+    invalidate_cart_summary(user)
+    return order
+
+
+# action -> (status an order must have, status it moves to)
+MODERATION_ACTIONS = {
+    'approve': ('pending', 'approved'),
+    'reject': ('pending', 'rejected'),
+    'complete': ('approved', 'completed'),
+}
+
+# Timestamp column set when an order enters each status
+STATUS_TIMESTAMPS = {
+    'approved': 'approved_at',
+    'rejected': 'rejected_at',
+    'completed': 'completed_at',
+}
+
+# Keeps each IN (...) list well under SQLite's bound parameter limit
+MODERATION_CHUNK_SIZE = 500
+
+
+def moderate_orders(order_ids, action, rejection_reason="Rejected by admin", changed_by=None):
+    """
+    Apply ``action`` ('approve', 'reject' or 'complete') to many orders in one
+    transaction and return ``{order_id: result}``.
+
+    The result is the new status for orders that moved, 'not_found' for
+    unknown ids and 'invalid_status' for orders in the wrong state. Orders
+    move with one UPDATE per chunk that sets the status and its timestamp,
+    and every move is recorded in OrderStatusChange with a bulk insert and
+    counted in the daily sales rollups. Rejections put the orders' units
+    back in stock, and approvals queue their notifications in one batch.
+    """
+    from_status, to_status = MODERATION_ACTIONS[action]
+    order_ids = list(dict.fromkeys(order_ids))
+    results = dict.fromkeys(order_ids, 'not_found')
+    changes = {'status': to_status, STATUS_TIMESTAMPS[to_status]: timezone.now()}
+    if action == 'reject':
+        changes['rejection_reason'] = rejection_reason
+
+    with transaction.atomic():
+        moved = []
+        for start in range(0, len(order_ids), MODERATION_CHUNK_SIZE):
+            chunk = order_ids[start:start + MODERATION_CHUNK_SIZE]
+            # A no-op UPDATE locks the rows (and takes SQLite's write lock) before they are read
+            Order.objects.filter(id__in=chunk).update(status=F('status'))
+            chunk_moved = []
+            for order in Order.objects.filter(id__in=chunk).select_related('user'):
+                if order.status == from_status:
+                    for field, value in changes.items():
+                        setattr(order, field, value)
+                    chunk_moved.append(order)
+                    results[order.id] = to_status
+                else:
+                    results[order.id] = 'invalid_status'
+            Order.objects.filter(id__in=[order.id for order in chunk_moved]).update(**changes)
+            moved.extend(chunk_moved)
+
+        OrderStatusChange.objects.bulk_create([
+            OrderStatusChange(
+                order=order, from_status=from_status, to_status=to_status,
+                changed_by=changed_by, changed_at=changes[STATUS_TIMESTAMPS[to_status]],
+                note=rejection_reason if action == 'reject' else '',
+            )
+            for order in moved
+        ], batch_size=MODERATION_CHUNK_SIZE)
+        record_transition(moved, to_status, changes[STATUS_TIMESTAMPS[to_status]])
+        if action == 'reject':
+            release_stock([order.id for order in moved])
+        if action == 'approve':
+            queue_orders_approved(moved)
+
+    return results
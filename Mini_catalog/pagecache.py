@@ -0,0 +1,126 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, urlencode
+
+from .routing import reading_from_replica
+
+# Query parameters that change what a catalog page shows. Anything else
+# (tracking tags, cache busters) is dropped from the cache key.
+PAGE_CACHE_PARAMS = ['category', 'min_price', 'max_price', 'search', 'after', 'before']
+
+_GENERATION_KEY = 'page-cache:generation'
+_PURGED_AT_KEY = 'page-cache:purged-at'
+
+
+def _cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _generation(cache):
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        # Start from the clock so a restarted locmem cache never reuses old keys
+        generation = time.time_ns()
+        cache.add(_GENERATION_KEY, generation, None)
+    return generation
+
+
+def normalize_query(query_dict):
+    """
+    Reduce a QueryDict to the parameters a page depends on, in a stable order.
+
+    Values are kept exactly as sent: the filter form echoes them back, so
+    ``?search=Phone`` and ``?search=phone`` are different pages.
+    """
+    return urlencode([(name, query_dict.get(name)) for name in PAGE_CACHE_PARAMS if name in query_dict])
+
+
+def page_cache_key(request, view_name, view_kwargs, generation):
+    args = ','.join(f'{name}={value}' for name, value in sorted(view_kwargs.items()))
+    raw = f'{view_name}|{args}|{normalize_query(request.GET)}'
+    return f'page-cache:{generation}:{hashlib.sha256(raw.encode()).hexdigest()}'
+
+
+def _should_bypass(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return True
+    # Pending flash messages are rendered into the page once, so it must be fresh
+    return len(messages.get_messages(request)) > 0
+
+
+def _replica_may_lag(cache):
+    # A page read from the replica just after a purge may predate the change
+    # that caused it, and would then be cached until the next purge
+    if not reading_from_replica():
+        return False
+    return time.time() - cache.get(_PURGED_AT_KEY, 0) < settings.DB_REPLICA_PIN_SECONDS
+
+
+def _finish(request, response, etag, last_modified, status):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['X-Page-Cache'] = status
+    # Browsers revalidate every time and get a 304 while the page is unchanged.
+    # The same URL renders differently once logged in, hence Vary: Cookie.
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ['Cookie'])
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
+
+def cache_anonymous_page(view_func):
+    """
+    Serve anonymous GET requests for ``view_func`` from the page cache.
+
+    Pages are keyed on the view, its URL arguments and the normalized
+    catalog query string, and carry a strong ETag and Last-Modified so
+    repeat visits can be answered with 304 Not Modified. Logged-in users and
+    requests with pending flash messages always get a freshly rendered page.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not settings.PAGE_CACHE_ENABLED or _should_bypass(request):
+            response = view_func(request, *args, **kwargs)
+            response['X-Page-Cache'] = 'BYPASS'
+            return response
+
+        cache = _cache()
+        key = page_cache_key(request, view_func.__name__, kwargs, _generation(cache))
+        entry = cache.get(key)
+        if entry is not None:
+            content, content_type, etag, last_modified = entry
+            return _finish(request, HttpResponse(content, content_type=content_type), etag, last_modified, 'HIT')
+
+        response = view_func(request, *args, **kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        # Only store plain 200 pages that carry nothing specific to this visitor
+        if (
+            response.status_code != 200 or response.streaming or response.cookies
+            or request.META.get('CSRF_COOKIE_NEEDS_UPDATE') or _replica_may_lag(cache)
+        ):
+            response['X-Page-Cache'] = 'BYPASS'
+            return response
+
+        etag = '"%s"' % hashlib.sha256(response.content).hexdigest()[:32]
+        last_modified = int(time.time())
+        cache.set(key, (response.content, response['Content-Type'], etag, last_modified), settings.PAGE_CACHE_TIMEOUT)
+        return _finish(request, response, etag, last_modified, 'MISS')
+
+    return wrapper
+
+
+def purge_pages(**kwargs):
+    """Invalidate every cached page by moving to a new key generation (used as a signal receiver)."""
+    cache = _cache()
+    try:
+        cache.incr(_GENERATION_KEY)
+    except ValueError:
+        cache.set(_GENERATION_KEY, time.time_ns(), None)
+    cache.set(_PURGED_AT_KEY, time.time(), None)
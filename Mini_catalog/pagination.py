@@ -0,0 +1,75 @@
+# Number of product cards shown per catalog page.
+PAGE_SIZE = 24
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to link to its neighbours."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def parse_cursor(value):
+    """Return a cursor from the query string as an int, or None if it is missing or malformed."""
+    if value and value.isdigit():
+        return int(value)
+    return None
+
+
+def keyset_page(queryset, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    Page through ``queryset`` ordered by id, seeking on the id instead of
+    using OFFSET so every page costs the same no matter how deep it is.
+    """
+    if before is not None:
+        rows = list(queryset.filter(id__lt=before).order_by('-id')[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            queryset = queryset.filter(id__gt=after)
+        rows = list(queryset.order_by('id')[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = after is not None
+
+    return KeysetPage(
+        rows,
+        next_cursor=rows[-1].id if rows and has_next else None,
+        previous_cursor=rows[0].id if rows and has_previous else None,
+    )
+
+
+def list_page(items, after=None, before=None, page_size=PAGE_SIZE):
+    """Same cursors as keyset_page, for an already-ranked list such as search results."""
+    positions = {item.id: index for index, item in enumerate(items)}
+    if before is not None and before in positions:
+        end = positions[before]
+        start = max(end - page_size, 0)
+    else:
+        start = positions[after] + 1 if after in positions else 0
+        end = start + page_size
+    rows = items[start:end]
+
+    return KeysetPage(
+        rows,
+        next_cursor=rows[-1].id if rows and end < len(items) else None,
+        previous_cursor=rows[0].id if rows and start > 0 else None,
+    )
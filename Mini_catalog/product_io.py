@@ -0,0 +1,220 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django import forms
+from django.db import router, transaction
+
+from .bulkupdate import bulk_update_products
+from .forms import parse_price
+from .models import Category, Product
+from .pagecache import purge_pages
+from .search import index_products
+
+# Columns read by the importer and written by the exporter, in file order
+PRODUCT_COLUMNS = ['id', 'name', 'description', 'price', 'discount_percentage', 'stock', 'category']
+
+# Rows written per transaction; also keeps each IN (...) list under SQLite's parameter limit
+IMPORT_CHUNK_SIZE = 500
+
+# Rows fetched per round trip while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# Import errors kept for the report; the count still covers every bad row
+MAX_REPORTED_ERRORS = 100
+
+PRODUCT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/jsonl',
+}
+
+# Largest price Product.price (10 digits, 2 decimal places) can hold, exclusive
+_MAX_PRICE = Decimal(10) ** 8
+
+
+class ImportReport:
+    """Counts and errors from one import, plus its throughput."""
+
+    def __init__(self):
+        self.rows = self.created = self.updated = 0
+        self.errors = []
+        self.error_count = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line number, record dict, error)`` for each record in a text stream of CSV or JSONL."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'Invalid JSON: {e}'
+            continue
+        if isinstance(record, dict):
+            yield line_number, record, None
+        else:
+            yield line_number, None, 'Each line must be a JSON object.'
+
+
+def _parse_stock(value):
+    text = str(value).strip().replace(',', '') or '0'
+    if not text.isdigit():
+        raise forms.ValidationError(f'Stock must be a whole number of units, not "{value}".')
+    return int(text)
+
+
+def _parse_price(value):
+    # Same parsing as ProductForm, so "1,000" works here too
+    price = Decimal(str(parse_price(value)))
+    if not price.is_finite() or price >= _MAX_PRICE:
+        raise forms.ValidationError('Enter a valid price (e.g., 1000 or 1,000).')
+    return price.quantize(Decimal('0.01'))
+
+
+def _clean_row(record, categories):
+    """
+    Turn one record into Product field values, raising ValidationError on
+    bad data. Only the columns the record has are returned, so updating a
+    product leaves the ones missing from the file alone; a new product
+    needs at least a name and a price.
+    """
+    product_id = str(record.get('id') or '').strip()
+    if product_id and not product_id.isdigit():
+        raise forms.ValidationError('Product id must be a number.')
+    creating = not product_id
+
+    values = {}
+    if creating or 'name' in record:
+        name = str(record.get('name') or '').strip()
+        if not name:
+            raise forms.ValidationError('Name is required.')
+        if len(name) > Product._meta.get_field('name').max_length:
+            raise forms.ValidationError('Name is too long.')
+        values['name'] = name
+    if 'description' in record:
+        values['description'] = str(record['description'] or '')
+    if creating or 'price' in record:
+        values['price'] = _parse_price(record.get('price', ''))
+    if 'stock' in record:
+        values['stock'] = _parse_stock(record['stock'] or '')
+    if 'discount_percentage' in record:
+        try:
+            discount = Decimal(str(record['discount_percentage'] or 0))
+        except InvalidOperation:
+            raise forms.ValidationError('Enter a valid discount percentage.')
+        if not discount.is_finite() or not 0 <= discount <= 100:
+            raise forms.ValidationError('Discount percentage must be between 0 and 100.')
+        values['discount_percentage'] = discount
+    if 'category' in record:
+        category = str(record['category'] or '').strip()
+        if category and category.lower() not in categories:
+            raise forms.ValidationError(f'Unknown category "{category}".')
+        values['category_id'] = categories.get(category.lower()) if category else None
+    if not values:
+        raise forms.ValidationError('No product columns to update.')
+    return (None if creating else int(product_id)), values
+
+
+def _write_chunk(chunk, report):
+    """Create and update one chunk of cleaned rows in a single transaction."""
+    using = router.db_for_write(Product)
+    with transaction.atomic(using=using):
+        ids = [pk for _, pk, _ in chunk if pk]
+        existing = set(Product.objects.using(using).filter(pk__in=ids).values_list('pk', flat=True))
+        new, changed = [], {}
+        for line, pk, values in chunk:
+            if pk and pk not in existing:
+                report.add_error(line, f'No product with id {pk}.')
+            elif pk:
+                # Rows are grouped by the columns they set; a CSV file makes one group
+                changed.setdefault(tuple(values), []).append((pk, values))
+            else:
+                new.append(Product(version=1, **values))
+        created = Product.objects.using(using).bulk_create(new)
+        updated = []
+        for fields, rows in changed.items():
+            bulk_update_products(fields, rows, using)
+            updated += [pk for pk, _ in rows]
+        # No post_save signals either: refresh the search index by hand
+        index_products([product.pk for product in created] + updated, using)
+    report.created += len(created)
+    report.updated += len(updated)
+
+
+def import_products(records, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+    """
+    Create or update products from ``records``, an iterable of
+    ``(line, dict, error)`` as yielded by read_rows(). Rows with an id
+    update that product; rows without one create a product. Valid rows are
+    written ``chunk_size`` at a time, each chunk in its own transaction, so
+    a bad row is reported without losing the rest of the file.
+    """
+    report = ImportReport()
+    # Category names resolve from one lookup table instead of a query per row
+    categories = {name.lower(): pk for pk, name in Category.objects.values_list('id', 'name')}
+    chunk = []
+    for line, record, error in records:
+        report.rows += 1
+        if error is None:
+            try:
+                pk, values = _clean_row(record, categories)
+            except forms.ValidationError as e:
+                error = ' '.join(e.messages)
+        if error is not None:
+            report.add_error(line, error)
+            continue
+        chunk.append((line, pk, values))
+        if len(chunk) >= chunk_size:
+            if not dry_run:
+                _write_chunk(chunk, report)
+            chunk = []
+    if chunk and not dry_run:
+        _write_chunk(chunk, report)
+    if (report.created or report.updated) and not dry_run:
+        purge_pages()
+    report.seconds = time.perf_counter() - report.started
+    return report
+
+
+def export_rows(queryset=None):
+    """Yield each product as a dict of PRODUCT_COLUMNS, streaming from the database."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    columns = ['id', 'name', 'description', 'price', 'discount_percentage', 'stock', 'category__name']
+    for values in queryset.order_by('id').values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield dict(zip(PRODUCT_COLUMNS, values))
+
+
+class _Echo:
+    # csv.writer target that hands back each line instead of buffering it
+    def write(self, value):
+        return value
+
+
+def serialize_rows(rows, fmt):
+    """Yield CSV or JSONL text for ``rows``, one line at a time."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(PRODUCT_COLUMNS)
+        for row in rows:
+            yield writer.writerow(['' if row[column] is None else row[column] for column in PRODUCT_COLUMNS])
+        return
+    for row in rows:
+        yield json.dumps({**row, 'price': str(row['price']), 'discount_percentage': str(row['discount_percentage'])}) + '\n'
@@ -0,0 +1,205 @@
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+logger = logging.getLogger(__name__)
+
+_PROJECT_DIR = str(settings.BASE_DIR) + os.sep
+
+# Literals are replaced so statements that differ only in their parameters
+# share one shape, e.g. "... WHERE id = ?".
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:(?:%s|\?), )*(?:%s|\?)\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def normalize_sql(sql):
+    """Reduce a SQL statement to its shape by masking literal values."""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+def _query_origin():
+    """
+    Return "template.html:line" for the innermost template node being
+    rendered, or "file.py:line" for the project code that ran the query.
+    """
+    code_position = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return f'{origin.template_name or origin.name}:{token.lineno}'
+        filename = frame.f_code.co_filename
+        if code_position is None and filename.startswith(_PROJECT_DIR) and filename != __file__:
+            code_position = f'{os.path.relpath(filename, _PROJECT_DIR)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return code_position
+
+
+class QueryRecorder:
+    """Database execute wrapper that records every statement run while it is installed."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'shape': normalize_sql(sql),
+                'time': time.perf_counter() - start,
+                'origin': _query_origin(),
+            })
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(query['time'] for query in self.queries)
+
+    def shapes(self):
+        return Counter(query['shape'] for query in self.queries)
+
+    def n_plus_one(self, threshold=None):
+        """
+        Return the statement shapes repeated at least ``threshold`` times,
+        most frequent first, with the template or code lines that ran them.
+        """
+        if threshold is None:
+            threshold = settings.QUERY_BUDGET_N_PLUS_ONE_THRESHOLD
+        suspects = []
+        for shape, count in self.shapes().most_common():
+            if count < threshold:
+                break
+            origins = sorted({
+                query['origin'] for query in self.queries
+                if query['shape'] == shape and query['origin']
+            })
+            suspects.append({'shape': shape, 'count': count, 'origins': origins})
+        return suspects
+
+    def report(self):
+        lines = [f'{self.count} queries in {self.total_time * 1000:.1f} ms']
+        for suspect in self.n_plus_one():
+            where = ', '.join(suspect['origins']) or 'unknown code'
+            lines.append(f"  N+1 x{suspect['count']} from {where}: {suspect['shape']}")
+        return '\n'.join(lines)
+
+
+def query_budget(max_queries):
+    """Declare how many queries a view may run per request."""
+    def decorator(view_func):
+        # Outer decorators copy this attribute along via functools.wraps
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+class QueryBudgetMiddleware:
+    """
+    Records every SQL statement per request when QUERY_BUDGET_ENABLED is on.
+
+    The query count and database time go out in X-Query-Count and
+    X-Query-Time-Ms headers, repeated statement shapes are logged as likely
+    N+1 patterns, and with QUERY_BUDGET_STRICT a view that runs more queries
+    than its @query_budget raises QueryBudgetExceeded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        request.query_budget = None
+        with recorder.record():
+            response = self.get_response(request)
+            # Lazy template responses run their queries during rendering
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time-Ms'] = f'{recorder.total_time * 1000:.1f}'
+        suspects = recorder.n_plus_one()
+        if suspects:
+            response['X-Query-N-Plus-One'] = str(len(suspects))
+            logger.warning('Possible N+1 queries on %s\n%s', request.path, recorder.report())
+
+        budget = request.query_budget
+        if budget is not None:
+            response['X-Query-Budget'] = str(budget)
+            if recorder.count > budget:
+                message = f'{request.path} ran {recorder.count} queries, budget is {budget}\n{recorder.report()}'
+                if settings.QUERY_BUDGET_STRICT:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if settings.QUERY_BUDGET_ENABLED:
+            request.query_budget = getattr(view_func, 'query_budget', None)
+        return None
+
+
+class QueryBudgetTestMixin:
+    """TestCase helpers that fail on query budget overruns and N+1 patterns."""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, allow_n_plus_one=False):
+        recorder = QueryRecorder()
+        with recorder.record():
+            yield recorder
+        if recorder.count > max_queries:
+            self.fail(f'Ran {recorder.count} queries, budget is {max_queries}\n{recorder.report()}')
+        if not allow_n_plus_one and recorder.n_plus_one():
+            self.fail(f'Possible N+1 queries\n{recorder.report()}')
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """
+    Runs the tests with query recording and QUERY_BUDGET_STRICT on, so any
+    request in any test that goes over its view's @query_budget fails.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._strict_budgets = override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_STRICT=True)
+        self._strict_budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._strict_budgets.disable()
+        super().teardown_test_environment(**kwargs)
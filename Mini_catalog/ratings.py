@@ -0,0 +1,75 @@
+import random
+from decimal import Decimal
+
+from django.db import router, transaction
+
+from .bulkupdate import bulk_update_products
+from .models import Product
+from .pagecache import purge_pages
+
+# Products read and written per transaction
+RATING_CHUNK_SIZE = 1000
+
+# Ratings handed out by demo_ratings()
+DEMO_RATINGS = [Decimal('3.0'), Decimal('3.5'), Decimal('4.0'), Decimal('4.5'), Decimal('5.0')]
+
+_ONE_DECIMAL = Decimal('0.1')
+
+_RATING_FIELDS = ['rating', 'num_ratings']
+
+
+def demo_ratings(seed=None):
+    """A rating source that gives every product a random rating, for filling a demo catalog."""
+    rng = random.Random(seed)
+
+    def source(product_ids):
+        return {pk: (rng.choice(DEMO_RATINGS), rng.randint(10, 100)) for pk in product_ids}
+
+    return source
+
+
+def recompute_ratings(source, chunk_size=RATING_CHUNK_SIZE, dry_run=False, progress=None):
+    """
+    Walk the catalog in id order, ``chunk_size`` products at a time, and
+    store the ratings ``source`` gives them. ``source`` is called with a
+    list of product ids and returns ``{id: (rating, num_ratings)}``;
+    products it leaves out, or whose figures are unchanged, are not
+    written. Each chunk is written in its own short transaction, touching
+    only ``rating``, ``num_ratings`` and ``version``. ``progress`` is called
+    with the stats after every chunk. Returns a stats dict.
+    """
+    using = router.db_for_write(Product)
+    stats = {'products': 0, 'changed': 0}
+    last_id = 0
+    changed_any = False
+    while True:
+        rows = list(
+            Product.objects.using(using).filter(pk__gt=last_id).order_by('pk')
+            .values_list('pk', 'rating', 'num_ratings')[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        ratings = source([pk for pk, _, _ in rows])
+
+        changed = []
+        for pk, rating, num_ratings in rows:
+            if pk not in ratings:
+                continue
+            new_rating, new_count = ratings[pk]
+            new_rating = Decimal(str(new_rating)).quantize(_ONE_DECIMAL)
+            if (new_rating, new_count) != (rating, num_ratings):
+                changed.append((pk, {'rating': new_rating, 'num_ratings': new_count}))
+        stats['products'] += len(rows)
+        stats['changed'] += len(changed)
+
+        if changed and not dry_run:
+            with transaction.atomic(using=using):
+                bulk_update_products(_RATING_FIELDS, changed, using)
+            changed_any = True
+        if progress is not None:
+            progress(stats)
+
+    if changed_any:
+        purge_pages()
+    return stats
@@ -0,0 +1,113 @@
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+# Database alias of the read replica, configured by DB_REPLICA_NAME or DB_REPLICA_HOST
+REPLICA_ALIAS = 'replica'
+
+# Cookie that keeps a browser on the primary for a while after it wrote
+REPLICA_PIN_COOKIE = 'db_pin'
+
+# Only catalog and order data is read from the replica. Sessions and users
+# always come from the primary, so a lagging replica cannot sign anyone out.
+REPLICA_APP_LABELS = {'Mini_catalog'}
+
+_SAFE_METHODS = ('GET', 'HEAD')
+
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+class _RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.wrote = False
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def _replicated(model):
+    return model._meta.app_label in REPLICA_APP_LABELS
+
+
+def reading_from_replica():
+    """Whether reads in the current request go to the replica."""
+    state = _request_state.get()
+    return state is not None and state.replica_reads and not state.wrote
+
+
+def replica_reads(view_func):
+    """
+    Let ``view_func`` read catalog and order data from the replica on GET
+    and HEAD requests. Browsers that wrote in the last
+    DB_REPLICA_PIN_SECONDS stay on the primary, and so does the rest of a
+    request once it writes, so users always see their own changes.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        state = _request_state.get()
+        if state is None or state.pinned or request.method not in _SAFE_METHODS:
+            return view_func(request, *args, **kwargs)
+        state.replica_reads = True
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            state.replica_reads = False
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Sends reads made inside @replica_reads views to the replica and every
+    other query to the primary. Without a replica configured everything
+    uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica() and _replicated(model) and replica_configured():
+            return REPLICA_ALIAS
+        # Explicit, or objects loaded from the replica would route their
+        # related lookups back to it
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and _replicated(model):
+            state.wrote = True
+        # Explicit, or saving an object loaded from the replica would write to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+
+class ReplicaMiddleware:
+    """
+    Tracks writes per request for ReplicaRouter and pins the browser to the
+    primary with a short-lived cookie after any request that changed data.
+    Not used when no replica is configured.
+    """
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RequestState(pinned=REPLICA_PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state.wrote or request.method not in _SAFE_METHODS:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, '1', max_age=settings.DB_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,188 @@
+import re
+
+from django.db import connections
+from django.utils.html import escape
+
+from .models import Product
+
+# Name of the SQLite FTS5 table created by migration 0016_product_search_index.
+# Its rowid is the product id, so a hit maps straight back to a Product.
+FTS_TABLE = 'Mini_catalog_product_fts'
+
+# Text search configuration used for the Postgres tsvector and its GIN index.
+SEARCH_CONFIG = 'english'
+
+# Ranked search never returns more than this many products.
+SEARCH_MAX_RESULTS = 500
+
+# Markers put around matched terms by the database; swapped for <mark> tags
+# after the snippet text has been escaped.
+_START, _STOP = '\x02', '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# (alias, database name) pairs known to have the FTS5 table. Only hits are
+# remembered, so running migrate later does not need a restart.
+_fts_databases = set()
+
+
+def _tokens(query):
+    return _TOKEN_RE.findall(query or '')
+
+
+def _highlight(text):
+    return escape(text).replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def _has_fts_table(connection):
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _fts_databases:
+        with connection.cursor() as cursor:
+            if FTS_TABLE not in connection.introspection.table_names(cursor):
+                return False
+        _fts_databases.add(key)
+    return True
+
+
+def search_products(products, query, limit=SEARCH_MAX_RESULTS):
+    """
+    Full-text search over product names and descriptions.
+
+    Every word in ``query`` must match, and the last characters of each word
+    are treated as a prefix ("iph" finds "iPhone"). Returns a list of
+    products from ``products`` ordered by relevance, each with a
+    ``search_rank`` and an HTML-safe ``search_snippet`` attribute.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return _search_icontains(products, query, limit)
+
+    connection = connections[products.db]
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(products, tokens, limit)
+    if connection.vendor == 'sqlite' and _has_fts_table(connection):
+        return _search_sqlite(connection, products, tokens, limit)
+    return _search_icontains(products, query, limit)
+
+
+def _search_sqlite(connection, products, tokens, limit):
+    match = ' '.join('"%s"*' % token for token in tokens)
+    # Filters on ``products`` go inside the FTS query so LIMIT counts only
+    # products that pass them; an unfiltered catalog needs no subquery. The
+    # unary + stops FTS5 from running the MATCH once per id in the list.
+    restrict, params = '', []
+    if products.query.where:
+        id_sql, params = products.order_by().values('id').query.get_compiler(connection=connection).as_sql()
+        restrict = f'AND +rowid IN ({id_sql}) '
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, bm25({FTS_TABLE}, 10.0, 1.0), '
+            f"snippet({FTS_TABLE}, 1, %s, %s, '…', 16) "
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s {restrict}'
+            f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s',
+            [_START, _STOP, match, *params, limit],
+        )
+        hits = cursor.fetchall()
+
+    # bm25() is lower-is-better; flip it so search_rank reads like Postgres.
+    ranked = {pk: (position, -score, snippet) for position, (pk, score, snippet) in enumerate(hits)}
+    results = list(products.filter(id__in=ranked.keys()))
+    for product in results:
+        _, product.search_rank, snippet = ranked[product.id]
+        product.search_snippet = _highlight(snippet)
+    results.sort(key=lambda product: ranked[product.id][0])
+    return results
+
+
+def search_vector():
+    """The weighted tsvector Postgres searches; migration 0016 indexes this exact expression."""
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def _search_postgresql(products, tokens, limit):
+    from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+
+    vector = search_vector()
+    search_query = SearchQuery(
+        ' & '.join('%s:*' % token for token in tokens), search_type='raw', config=SEARCH_CONFIG,
+    )
+    results = list(
+        products.annotate(search_document=vector)
+        .filter(search_document=search_query)
+        .annotate(
+            search_rank=SearchRank(vector, search_query),
+            search_snippet=SearchHeadline(
+                'description', search_query, config=SEARCH_CONFIG,
+                start_sel=_START, stop_sel=_STOP, max_words=16, min_words=8,
+            ),
+        )
+        .order_by('-search_rank', 'id')[:limit]
+    )
+    for product in results:
+        product.search_snippet = _highlight(product.search_snippet)
+    return results
+
+
+def _search_icontains(products, query, limit):
+    results = list((products.filter(name__icontains=query) | products.filter(description__icontains=query))[:limit])
+    for product in results:
+        product.search_rank = 0
+        product.search_snippet = ''
+    return results
+
+
+def index_product(sender, instance, using, **kwargs):
+    """Write ``instance`` into the FTS5 table (post_save receiver)."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+            [instance.pk, instance.name, instance.description],
+        )
+
+
+def unindex_product(sender, instance, using, **kwargs):
+    """Remove ``instance`` from the FTS5 table (post_delete receiver)."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+
+
+def index_products(product_ids, using='default'):
+    """Rewrite the FTS5 rows of many products at once, e.g. after a bulk import that sent no signals."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not product_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(product_ids))
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+            f'SELECT id, name, description FROM {Product._meta.db_table} WHERE id IN ({placeholders})',
+            list(product_ids),
+        )
+
+
+def rebuild_index(using='default'):
+    """Repopulate the FTS5 table from Product. Returns the number of rows indexed."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        # Postgres searches an expression index that never goes stale.
+        return Product.objects.using(using).count()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+            f'SELECT id, name, description FROM {Product._meta.db_table}'
+        )
+        return cursor.rowcount
@@ -0,0 +1,64 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error
+from django.db import router, transaction
+from django.utils import timezone
+
+# Expired sessions deleted per transaction; also keeps each IN (...) list under SQLite's parameter limit
+SESSION_CLEANUP_CHUNK_SIZE = 500
+
+
+def session_model():
+    """The model SESSION_ENGINE stores sessions in, or None when they live in cookies or a cache."""
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    get_model_class = getattr(store, 'get_model_class', None)
+    return get_model_class() if get_model_class else None
+
+
+def check_session_cache(app_configs, **kwargs):
+    """
+    System check: sessions kept in a per-process cache would survive a
+    logout in every worker but the one that handled it.
+    """
+    if settings.SESSION_ENGINE not in ('django.contrib.sessions.backends.cache', 'django.contrib.sessions.backends.cached_db'):
+        return []
+    if not isinstance(caches[settings.SESSION_CACHE_ALIAS], LocMemCache):
+        return []
+    return [Error(
+        f'{settings.SESSION_ENGINE} needs a session cache shared by all workers.',
+        hint='Set SESSION_CACHE_BACKEND to e.g. django.core.cache.backends.redis.RedisCache, or SESSION_STRATEGY=db.',
+        id='Mini_catalog.E001',
+    )]
+
+
+def clear_expired_sessions(chunk_size=SESSION_CLEANUP_CHUNK_SIZE, dry_run=False, progress=None):
+    """
+    Delete sessions that have expired, ``chunk_size`` at a time, each chunk
+    in its own short transaction so logins and checkouts get the write lock
+    in between. ``clearsessions`` deletes them all in one statement, holding
+    the lock for as long as that takes. ``progress`` is called with the
+    running total after every chunk. Returns the number of sessions deleted,
+    or with ``dry_run`` the number that would be.
+    """
+    model = session_model()
+    if model is None:
+        return 0
+    using = router.db_for_write(model)
+    expired = model.objects.using(using).filter(expire_date__lt=timezone.now())
+    if dry_run:
+        return expired.count()
+
+    deleted = 0
+    while True:
+        keys = list(expired.values_list('pk', flat=True)[:chunk_size])
+        if not keys:
+            break
+        with transaction.atomic(using=using):
+            # Checked again in case a session was extended since it was listed
+            deleted += expired.filter(pk__in=keys).delete()[0]
+        if progress is not None:
+            progress(deleted)
+    return deleted
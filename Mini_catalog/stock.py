@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, Sum, Value, When
+
+from .models import Order, OrderItem, Product
+from .pagecache import purge_pages
+
+# Keeps each IN (...) list and CASE well under SQLite's bound parameter limit
+STOCK_CHUNK_SIZE = 500
+
+
+def _wanted(quantities, product_ids):
+    """CASE giving each product's quantity, for use in a query over ``product_ids``."""
+    return Case(
+        *[When(pk=product_id, then=Value(quantities[product_id])) for product_id in product_ids],
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
+def reserve_stock(quantities):
+    """
+    Take ``{product_id: quantity}`` out of stock and return the ids of
+    products that did not have enough. Each chunk of products is reserved
+    by one conditional ``UPDATE ... WHERE stock >= quantity``, which only
+    runs if none of them is short, so the query count does not grow with
+    the cart. Nothing is read first, so two checkouts can never both take
+    the last unit; stock is only read back to name the short products.
+    Call it inside the checkout transaction and roll back if anything
+    comes back.
+    """
+    short = []
+    for product_ids in _chunks(sorted(quantities), STOCK_CHUNK_SIZE):
+        wanted = _wanted(quantities, product_ids)
+        reserved = Product.objects.filter(
+            ~Exists(Product.objects.filter(pk__in=product_ids, stock__lt=_wanted(quantities, product_ids))),
+            pk__in=product_ids, stock__gte=wanted,
+        ).update(
+            stock=F('stock') - wanted,
+            # Cached cards show "In Stock", so selling the last unit moves to a new version
+            version=Case(When(stock=wanted, then=F('version') + 1), default=F('version'), output_field=IntegerField()),
+        )
+        if reserved < len(product_ids):
+            stock = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'stock'))
+            # Either nothing was taken, or everything that exists was and only deleted products are short
+            short += [
+                product_id for product_id in product_ids
+                if product_id not in stock or (not reserved and stock[product_id] < quantities[product_id])
+            ]
+    if not short and Product.objects.filter(pk__in=quantities, stock=0).exists():
+        transaction.on_commit(purge_pages)
+    return short
+
+
+def release_stock(order_ids):
+    """
+    Put the units reserved by ``order_ids`` back in stock, for orders
+    that reserved them and have not released them yet. Call it inside
+    the transaction that rejects the orders.
+    """
+    order_ids = list(Order.objects.filter(id__in=order_ids, stock_reserved=True).values_list('id', flat=True))
+    restocked = False
+    for chunk in _chunks(order_ids, STOCK_CHUNK_SIZE):
+        units = dict(
+            OrderItem.objects.filter(order_id__in=chunk).values('product_id')
+            .annotate(units=Sum('quantity')).values_list('product_id', 'units')
+        )
+        Order.objects.filter(id__in=chunk).update(stock_reserved=False)
+        for product_ids in _chunks(list(units), STOCK_CHUNK_SIZE):
+            restocked |= Product.objects.filter(pk__in=product_ids, stock=0).exists()
+            Product.objects.filter(pk__in=product_ids).update(
+                stock=F('stock') + Case(
+                    *[When(pk=product_id, then=Value(units[product_id])) for product_id in product_ids],
+                    default=Value(0), output_field=IntegerField(),
+                ),
+                version=Case(When(stock=0, then=F('version') + 1), default=F('version'), output_field=IntegerField()),
+            )
+    if restocked:
+        transaction.on_commit(purge_pages)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,205 @@
+import hashlib
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+# Folder used for names saved without one
+DEFAULT_NAMESPACE = 'blobs'
+
+
+def _blob_model():
+    # storage.py is imported by models.py, so the model is looked up lazily
+    return apps.get_model('Mini_catalog', 'MediaBlob')
+
+
+def content_digest(content):
+    """SHA-256 of a File, reusing the digest ProofUploadHandler computed while streaming."""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+@deconstructible(path='Mini_catalog.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps one copy of each distinct file.
+
+    Files are stored as ``<namespace>/<aa>/<sha256><ext>``, where the
+    namespace is the first folder of the name the caller asked for. Saving
+    bytes that are already stored returns the existing name and writes
+    nothing. Every stored file has a MediaBlob row counting the references
+    to it; ``delete()`` only drops a reference, and unreferenced files are
+    removed by ``manage.py gc_media``.
+    """
+
+    def __init__(self, location=None, base_url=None, label='default', **kwargs):
+        # Identical names always hold identical bytes, so a concurrent write may overwrite
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(location=location, base_url=base_url, **kwargs)
+        self.label = label
+
+    def blob_name(self, name, digest, extension=None):
+        folder = name.replace('\\', '/').rpartition('/')[0]
+        namespace = folder.split('/')[0] or DEFAULT_NAMESPACE
+        if extension is None:
+            extension = os.path.splitext(name)[1].lower()
+        return f'{namespace}/{digest[:2]}/{digest}{extension}'
+
+    def store(self, name, content):
+        """
+        Store ``content`` and take a reference to it. Returns the stored name
+        and whether the bytes were new to this storage.
+        """
+        MediaBlob = _blob_model()
+        digest = content_digest(content)
+        blob = MediaBlob.objects.filter(storage=self.label, sha256=digest).first()
+        if blob is not None and self.exists(blob.name):
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1, last_stored_at=timezone.now())
+            return blob.name, False
+
+        stored = super()._save(self.blob_name(name, digest), content)
+        blob, created = MediaBlob.objects.get_or_create(
+            storage=self.label, sha256=digest,
+            defaults={'name': stored, 'size': self.size(stored), 'refcount': 1},
+        )
+        if not created:
+            # The row outlived its file, or a concurrent upload of the same bytes created it
+            MediaBlob.objects.filter(pk=blob.pk).update(
+                name=stored, size=self.size(stored), refcount=F('refcount') + 1, last_stored_at=timezone.now(),
+            )
+        return stored, True
+
+    def _save(self, name, content):
+        return self.store(name, content)[0]
+
+    def replace(self, name, content, extension):
+        """
+        Swap the file stored as ``name`` for ``content`` (e.g. a recompressed
+        copy) under the same key, so later uploads of the original bytes get
+        the replacement. Returns the new name. Call it in the transaction
+        that repoints references, then ``remove()`` the old file.
+        """
+        MediaBlob = _blob_model()
+        blob = MediaBlob.objects.get(storage=self.label, name=name)
+        new_name = super()._save(self.blob_name(name, blob.sha256, extension), content)
+        MediaBlob.objects.filter(pk=blob.pk).update(name=new_name, size=self.size(new_name))
+        return new_name
+
+    def delete(self, name):
+        """Drop one reference to ``name``; the file stays until garbage collection."""
+        _blob_model().objects.filter(storage=self.label, name=name, refcount__gt=0).update(
+            refcount=F('refcount') - 1,
+        )
+
+    def remove(self, name):
+        """Delete the file itself, whatever refers to it."""
+        super().delete(name)
+
+
+def count_references():
+    """Return a Counter of (storage label, name) for every stored file a row refers to."""
+    Order = apps.get_model('Mini_catalog', 'Order')
+    references = Counter()
+    proofs = Order.objects.exclude(proof_of_payment='').exclude(proof_of_payment__isnull=True)
+    for name in proofs.values_list('proof_of_payment', flat=True).iterator():
+        references['proofs', name] += 1
+    for model_name in ('Product', 'library'):
+        model = apps.get_model('Mini_catalog', model_name)
+        rows = model.objects.exclude(image_variants={}).values_list('image_variants', flat=True)
+        for variants in rows.iterator():
+            for name in [variants.get('original'), *variants.get('files', [])]:
+                if name:
+                    references['images', name] += 1
+    return references
+
+
+def collect_garbage(storages, grace=timedelta(hours=1), dry_run=False, batch_size=500):
+    """
+    Reset every MediaBlob refcount from the rows that actually refer to the
+    file, then delete files nothing refers to. Files stored within ``grace``
+    are kept, as the order or product referring to them may not be
+    committed yet. Returns a stats dict.
+    """
+    MediaBlob = _blob_model()
+    storages = {storage.label: storage for storage in storages}
+    references = count_references()
+    stats = {'blobs': 0, 'recounted': 0, 'removed': 0, 'removed_bytes': 0, 'stored_bytes': 0, 'saved_bytes': 0}
+
+    cutoff = timezone.now() - grace
+    changed, garbage = [], []
+    for blob in MediaBlob.objects.filter(storage__in=storages).iterator():
+        refcount = references.get((blob.storage, blob.name), 0)
+        stats['blobs'] += 1
+        if refcount != blob.refcount:
+            blob.refcount = refcount
+            changed.append(blob)
+        if refcount:
+            stats['stored_bytes'] += blob.size
+            # Without deduplication every reference would have its own copy
+            stats['saved_bytes'] += (refcount - 1) * blob.size
+        elif blob.last_stored_at < cutoff:
+            garbage.append(blob)
+    stats['recounted'] = len(changed)
+    stats['removed'] = len(garbage)
+    stats['removed_bytes'] = sum(blob.size for blob in garbage)
+    if dry_run:
+        return stats
+
+    for start in range(0, len(changed), batch_size):
+        with transaction.atomic():
+            MediaBlob.objects.bulk_update(changed[start:start + batch_size], ['refcount'])
+    for blob in garbage:
+        with transaction.atomic():
+            # A reference taken since the recount keeps the file
+            if MediaBlob.objects.filter(pk=blob.pk, refcount=0).delete()[0]:
+                storages[blob.storage].remove(blob.name)
+    return stats
+
+
+def adopt_proofs(storage, dry_run=False):
+    """
+    Move proofs saved before content addressing (``threads.png``,
+    ``threads_SAQpEP3.png``, ...) into ``storage`` and repoint their orders,
+    so identical legacy files collapse into one. Returns a stats dict.
+    """
+    MediaBlob = _blob_model()
+    Order = apps.get_model('Mini_catalog', 'Order')
+    known = set(MediaBlob.objects.filter(storage=storage.label).values_list('name', flat=True))
+    names = (
+        Order.objects.exclude(proof_of_payment='').exclude(proof_of_payment__isnull=True)
+        .values_list('proof_of_payment', flat=True).distinct()
+    )
+    stats = {'adopted': 0, 'adopted_bytes': 0, 'freed_bytes': 0}
+    seen = set()
+    for name in names:
+        if name in known or not storage.exists(name):
+            continue
+        size = storage.size(name)
+        stats['adopted'] += 1
+        stats['adopted_bytes'] += size
+        with storage.open(name) as f:
+            if dry_run:
+                digest = content_digest(f)
+                if digest in seen:
+                    stats['freed_bytes'] += size
+                seen.add(digest)
+                continue
+            new_name, created = storage.store(f'proofs/{name}', f)
+        if not created:
+            stats['freed_bytes'] += size
+        with transaction.atomic():
+            Order.objects.filter(proof_of_payment=name).update(proof_of_payment=new_name)
+        storage.remove(name)
+    return stats
@@ -1,3 +1,1312 @@
-from django.test import TestCase
+import json
+import os
+import re
+import threading
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from cloudinary import CloudinaryResource
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.db.models import Sum
+from django.db.models.query import QuerySet
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse, QueryDict
+from django.urls import path, reverse
+from django.utils import timezone
+from PIL import Image
+
+from .analytics import dashboard_summary
+from .cart import add_item, change_quantity
+from .carousel import SLIDES_MAX_AGE, check_default_cache, get_slides, invalidate_slides
+from .categories import CATEGORY_NAMES, clear_categories, get_categories
+from .images import image_storage, queue_derivatives
+from .models import (
+    Cart, CartItem, Category, DailyProductSales, DailySales, InboxMessage, MediaBlob, Notification, Order, OrderItem,
+    OrderStatusChange, Product, Wishlist, WishlistItem, library,
+)
+from .notifications import claim_due, deliver_batch
+from .orders import CheckoutError, moderate_orders, place_order
+from .pagecache import purge_pages
+from .pagination import PAGE_SIZE, keyset_page, list_page, parse_cursor
+from .product_io import export_rows, import_products, read_rows, serialize_rows
+from .querybudget import QueryBudgetExceeded, QueryBudgetTestMixin, normalize_sql, query_budget
+from .ratings import recompute_ratings
+from .routing import REPLICA_ALIAS, REPLICA_PIN_COOKIE, replica_configured
+from .search import search_products
+from .sessions import check_session_cache, clear_expired_sessions
+from .storage import collect_garbage
+from .uploads import proof_storage
+
+# Tables whose views must always be served from an index
+HOT_TABLES = [
+    User._meta.db_table,
+    Product._meta.db_table,
+    Order._meta.db_table,
+    InboxMessage._meta.db_table,
+]
+
+# "SCAN <table>" without an index is SQLite's full table scan
+FULL_SCAN_RE = re.compile(r'\bSCAN (%s)\b(?! USING)' % '|'.join(HOT_TABLES))
+
+
+class PrimaryClient(Client):
+    """
+    Test client that keeps every request on the primary. Test rows are only
+    written to the primary's test database, so with DB_REPLICA_NAME set the
+    replica would not see them. ReplicaRoutingTests covers the routing itself.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cookies[REPLICA_PIN_COOKIE] = '1'
+
+    def logout(self):
+        super().logout()
+        self.cookies[REPLICA_PIN_COOKIE] = '1'
+
+
+class CategoryRegistryTests(TestCase):
+    client_class = PrimaryClient
+
+    def setUp(self):
+        # Rollbacks send no signals, so don't leave this test's rows in the registry
+        self.addCleanup(clear_categories)
+        clear_categories()
+
+    def test_product_list_does_not_write_categories(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('product_list'))
+        writes = [
+            query['sql'] for query in queries
+            if Category._meta.db_table in query['sql'] and not query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+        self.assertEqual(writes, [])
+
+    def test_saving_or_deleting_a_category_reloads_the_registry(self):
+        self.assertEqual([category.name for category in get_categories()], CATEGORY_NAMES)
+        Category.objects.get(name='Luxury').delete()
+        self.assertEqual([category.name for category in get_categories()], ['Affordable'])
+        Category.objects.create(name='Luxury')
+        self.assertEqual([category.name for category in get_categories()], ['Affordable', 'Luxury'])
+        with self.assertNumQueries(0):
+            get_categories()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'checks the SQLite FTS5 search')
+class SearchTests(TestCase):
+    client_class = PrimaryClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.luxury, cls.affordable = (Category.objects.get(name=name) for name in ('Luxury', 'Affordable'))
+        for i in range(5):
+            Product.objects.create(name=f'iPhone {i}', description='Flagship phone', price=Decimal('900'), category=cls.luxury)
+        for i in range(3):
+            Product.objects.create(
+                name=f'Cover {i}', description='Fits any <b>phone</b> snugly', price=Decimal('10'), category=cls.affordable,
+            )
+
+    def names(self, products, query, **kwargs):
+        return [product.name for product in search_products(products, query, **kwargs)]
+
+    def test_name_matches_rank_above_description_matches(self):
+        names = self.names(Product.objects.all(), 'phone')
+        self.assertEqual(len(names), 8)
+        self.assertTrue(all(name.startswith('iPhone') for name in names[:5]), names)
+
+    def test_last_characters_of_each_word_match_as_a_prefix(self):
+        self.assertEqual(len(self.names(Product.objects.all(), 'iph flag')), 5)
+        self.assertEqual(self.names(Product.objects.all(), 'iph cov'), [])
+
+    def test_snippets_mark_matches_and_escape_the_description(self):
+        cover = search_products(Product.objects.filter(category=self.affordable), 'snug')[0]
+        self.assertIn('<mark>snugly</mark>', cover.search_snippet)
+        self.assertIn('&lt;b&gt;phone&lt;/b&gt;', cover.search_snippet)
+
+    def test_filters_apply_before_the_result_limit(self):
+        # The five iPhones outrank every cover, so limiting first would leave no covers
+        names = self.names(Product.objects.filter(category=self.affordable), 'phone', limit=3)
+        self.assertEqual(sorted(names), ['Cover 0', 'Cover 1', 'Cover 2'])
+        self.assertEqual(len(self.names(Product.objects.filter(price__gte=100), 'phone', limit=3)), 3)
+
+    def test_promo_sections_only_show_search_matches(self):
+        Product.objects.filter(name__in=['iPhone 0', 'Cover 0']).update(discount_percentage=Decimal('60'))
+        Product.objects.filter(name='Cover 1').update(price=Decimal('50'))
+        self.client.force_login(User.objects.create_user('buyer'))
+        response = self.client.get(reverse('product_list'), {'search': 'iph'})
+        for section in ('amazing_discounts', 'clearance_sales'):
+            self.assertEqual([product.name for product in response.context[section]], ['iPhone 0'])
+        self.assertEqual(list(response.context['bogo_offers']), [])
+
+    def test_index_table_is_looked_up_once(self):
+        search_products(Product.objects.all(), 'phone')
+        # The FTS query and the product fetch
+        with self.assertNumQueries(2):
+            search_products(Product.objects.all(), 'phone')
+
+
+class PaginationTests(TestCase):
+    client_class = PrimaryClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = get_categories()[0]
+        Product.objects.bulk_create([
+            Product(name=f'Item {i}', description='Test product', price=Decimal(10 + i), category=cls.category)
+            for i in range(PAGE_SIZE + 6)
+        ])
+        cls.ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+    def page_ids(self, page):
+        return [product.id for product in page]
+
+    def test_keyset_pages_walk_forward_and_back(self):
+        ids, products = self.ids[:5], Product.objects.filter(id__in=self.ids[:5])
+        first = keyset_page(products, page_size=2)
+        self.assertEqual((self.page_ids(first), first.has_previous, first.next_cursor), (ids[:2], False, ids[1]))
+        second = keyset_page(products, after=first.next_cursor, page_size=2)
+        self.assertEqual((self.page_ids(second), second.previous_cursor, second.next_cursor), (ids[2:4], ids[2], ids[3]))
+        last = keyset_page(products, after=second.next_cursor, page_size=2)
+        self.assertEqual((self.page_ids(last), last.has_next, last.previous_cursor), (ids[4:], False, ids[4]))
+
+        back = keyset_page(products, before=last.previous_cursor, page_size=2)
+        self.assertEqual((self.page_ids(back), back.has_previous, back.has_next), (ids[2:4], True, True))
+        start = keyset_page(products, before=back.previous_cursor, page_size=2)
+        self.assertEqual((self.page_ids(start), start.has_previous, start.next_cursor), (ids[:2], False, ids[1]))
+
+    def test_keyset_page_past_the_end_is_empty(self):
+        page = keyset_page(Product.objects.all(), after=self.ids[-1])
+        self.assertEqual((len(page), page.has_next, page.has_previous), (0, False, False))
+
+    def test_list_pages_follow_the_ranked_order(self):
+        items = list(Product.objects.filter(id__in=self.ids[:5]).order_by('-id'))
+        ranked = [item.id for item in items]
+        first = list_page(items, page_size=2)
+        self.assertEqual((self.page_ids(first), first.has_previous, first.next_cursor), (ranked[:2], False, ranked[1]))
+        last = list_page(items, after=ranked[3], page_size=2)
+        self.assertEqual((self.page_ids(last), last.has_next, last.previous_cursor), (ranked[4:], False, ranked[4]))
+        back = list_page(items, before=ranked[4], page_size=2)
+        self.assertEqual((self.page_ids(back), back.has_previous, back.has_next), (ranked[2:4], True, True))
+        # A cursor that is no longer in the results starts over
+        self.assertEqual(self.page_ids(list_page(items, after=-1, page_size=2)), ranked[:2])
+
+    def test_malformed_cursors_are_ignored(self):
+        self.assertEqual(parse_cursor('42'), 42)
+        for value in [None, '', '-1', '1.5', 'abc', '1e3']:
+            self.assertIsNone(parse_cursor(value), value)
+        self.client.force_login(User.objects.create_user('buyer'))
+        response = self.client.get(reverse('product_list'), {'after': 'abc'})
+        self.assertEqual(self.page_ids(response.context['products']), self.ids[:PAGE_SIZE])
+
+    def test_page_links_keep_the_filters(self):
+        self.client.force_login(User.objects.create_user('buyer'))
+        filters = {'category': str(self.category.id), 'min_price': '10'}
+        # Parameters the page ignores are left out of the links
+        first = self.client.get(reverse('product_list'), {**filters, 'utm_source': 'mail'})
+        self.assertIsNone(first.context['previous_query'])
+        next_query = QueryDict(first.context['next_query'])
+        self.assertEqual(next_query.dict(), {**filters, 'after': str(self.ids[PAGE_SIZE - 1])})
+
+        second = self.client.get(reverse('product_list') + '?' + first.context['next_query'])
+        self.assertEqual(self.page_ids(second.context['products']), self.ids[PAGE_SIZE:])
+        self.assertIsNone(second.context['next_query'])
+        # The old cursor is swapped out, not repeated
+        self.assertEqual(QueryDict(second.context['previous_query']).dict(), {**filters, 'before': str(self.ids[PAGE_SIZE])})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN checks are SQLite specific')
+class QueryPlanTests(TestCase):
+    """Fail if a hot view's queries fall back to a full table scan."""
+    client_class = PrimaryClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        category = get_categories()[0]
+        for i in range(5):
+            Product.objects.create(
+                name=f'Product {i}', description='Test product', price=Decimal(10 * (i + 1)),
+                discount_percentage=Decimal(i * 15), category=category,
+            )
+        now = timezone.now()
+        for status in ['pending', 'approved']:
+            Order.objects.create(user=cls.customer, status=status, delivery_address='Lagos')
+        Order.objects.create(user=cls.customer, status='completed', completed_at=now, delivery_address='Lagos')
+        Order.objects.create(user=cls.customer, status='rejected', rejected_at=now, delivery_address='Lagos')
+        InboxMessage.objects.create(user=cls.customer, subject='Hello', message='Welcome')
+
+    def assertNoFullScan(self, url, user=None):
+        if user:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or not any(table in sql for table in HOT_TABLES):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+            self.assertIsNone(FULL_SCAN_RE.search(plan), f'{url} runs a full scan:\n{sql}\n{plan}')
+
+    def test_price_range_filter(self):
+        self.assertNoFullScan(reverse('product_list') + '?min_price=10&max_price=40')
+
+    def test_category_and_price_filter(self):
+        category = get_categories()[0]
+        self.assertNoFullScan(reverse('product_list') + f'?category={category.id}&min_price=10&max_price=40')
+
+    def test_order_management(self):
+        self.assertNoFullScan(reverse('order_management'), self.staff)
+
+    def test_order_history(self):
+        self.assertNoFullScan(reverse('order_history'), self.customer)
+
+    def test_inbox(self):
+        self.assertNoFullScan(reverse('inbox'), self.customer)
+
+    def test_completed_orders(self):
+        self.assertNoFullScan(reverse('completed_orders'), self.staff)
+
+    def test_rejected_orders(self):
+        self.assertNoFullScan(reverse('rejected_orders'), self.staff)
+
+    def test_user_search(self):
+        self.assertNoFullScan(reverse('admin_users') + '?search=Cust&active=yes', self.staff)
+
+
+@override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    client_class = PrimaryClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.products = [
+            Product.objects.create(name=f'Product {i}', description='Test product', price=Decimal(100 + i))
+            for i in range(10)
+        ]
+        for status in ['pending', 'approved'] * 5:
+            order = Order.objects.create(user=cls.customer, status=status, delivery_address='Lagos')
+            for product in cls.products[:3]:
+                OrderItem.objects.create(order=order, product=product, quantity=2, price=product.price)
+
+    def test_normalize_sql_masks_literals(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+    def test_headers_report_query_count_and_time(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertIn('X-Query-Time-Ms', response)
+        self.assertEqual(response['X-Query-Budget'], '10')
+
+    def test_order_management_has_no_n_plus_one(self):
+        self.client.force_login(self.staff)
+        with self.assertQueryBudget(8):
+            response = self.client.get(reverse('order_management'))
+        self.assertNotIn('X-Query-N-Plus-One', response)
+
+    def test_n_plus_one_is_traced_to_template_line(self):
+        wishlist = Wishlist.objects.create(user=self.customer)
+        for product in self.products:
+            WishlistItem.objects.create(wishlist=wishlist, product=product)
+        self.client.force_login(self.customer)
+        with self.assertRaises(AssertionError) as raised:
+            with self.assertQueryBudget(100):
+                self.client.get(reverse('view_wishlist'))
+        self.assertIn('N+1 x10 from wishlist.html:', str(raised.exception))
+
+    def test_n_plus_one_in_view_code_is_traced_to_source_line(self):
+        cart = Cart.objects.create(user=self.customer)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product)
+        with self.assertRaises(AssertionError) as raised:
+            with self.assertQueryBudget(100):
+                for item in cart.cartitem_set.all():
+                    item.total_price()
+        self.assertIn('N+1 x10 from Mini_catalog/models.py:', str(raised.exception))
+
+    def test_cart_totals_and_badge_without_n_plus_one(self):
+        cart = Cart.objects.create(user=self.customer)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        self.client.force_login(self.customer)
+        with self.assertQueryBudget(8):
+            response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['cart_items_count'], 20)
+        self.assertEqual(response.context['total'], sum(product.price * 2 for product in self.products))
+
+        self.client.post(reverse('increase_quantity', args=[cart.cartitem_set.first().id]))
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['cart_items_count'], 21)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_strict_mode_raises_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/over-budget/')
+
+
+@query_budget(1)
+def over_budget_view(request):
+    return HttpResponse(str(Product.objects.count() + Order.objects.count()))
+
+
+urlpatterns = [
+    path('over-budget/', over_budget_view),
+]
+
+
+class NotificationOutboxTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.order = Order.objects.create(user=cls.customer, status='pending', delivery_address='Lagos')
+
+    def approve(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('approve_order', args=[self.order.id]))
+
+    def test_approval_queues_instead_of_sending(self):
+        self.approve()
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(
+            sorted(Notification.objects.filter(status='pending').values_list('channel', flat=True)),
+            ['email', 'inbox'],
+        )
+
+    def test_worker_delivers_email_and_inbox_message(self):
+        self.approve()
+        sent, failed = deliver_batch(claim_due(10))
+        self.assertEqual((sent, failed), (2, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['customer@example.com'])
+        self.assertEqual(InboxMessage.objects.filter(user=self.customer, message_type='order_update').count(), 1)
+        self.assertFalse(Notification.objects.exclude(status='sent').exists())
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_failed_email_is_retried_with_backoff(self):
+        self.approve()
+        with mock.patch('Mini_catalog.notifications.EmailMessage.send', side_effect=OSError('SMTP down')):
+            self.assertEqual(deliver_batch(claim_due(10)), (1, 1))
+        email = Notification.objects.get(channel='email')
+        self.assertEqual((email.status, email.attempts, email.last_error), ('pending', 1, 'SMTP down'))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(claim_due(10), [])
+
+        Notification.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+        with mock.patch('Mini_catalog.notifications.EmailMessage.send', side_effect=OSError('SMTP down')):
+            deliver_batch(claim_due(10))
+        self.assertEqual(Notification.objects.get(id=email.id).status, 'failed')
+
+
+class BulkModerationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        product = Product.objects.create(name='Phone', description='Test product', price=Decimal('100'))
+        cls.pending = []
+        for i in range(5):
+            order = Order.objects.create(user=cls.customer, delivery_address='Lagos', total_amount=200)
+            OrderItem.objects.create(order=order, product=product, quantity=2, price=product.price)
+            cls.pending.append(order.id)
+        cls.approved = Order.objects.create(user=cls.customer, status='approved', delivery_address='Lagos').id
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def moderate(self, action, order_ids):
+        response = self.client.post(
+            reverse('bulk_moderate_orders'), {'action': action, 'order_ids': order_ids},
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_bulk_approve_reports_per_order_results(self):
+        results = self.moderate('approve', self.pending + [self.approved, 999999])
+        self.assertEqual(results[str(self.pending[0])], 'approved')
+        self.assertEqual(results[str(self.approved)], 'invalid_status')
+        self.assertEqual(results['999999'], 'not_found')
+        self.assertEqual(Order.objects.filter(id__in=self.pending, status='approved').count(), 5)
+        self.assertEqual(Notification.objects.filter(channel='inbox').count(), 5)
+
+    def test_bulk_reject_keeps_order_and_line_items(self):
+        results = self.moderate('reject', self.pending)
+        self.assertEqual(set(results.values()), {'rejected'})
+        rejected = Order.objects.filter(id__in=self.pending, status='rejected', rejected_at__isnull=False)
+        self.assertEqual(rejected.count(), 5)
+        self.assertEqual(OrderItem.objects.filter(order__in=self.pending).count(), 5)
+        change = OrderStatusChange.objects.filter(order=self.pending[0]).get()
+        self.assertEqual((change.from_status, change.to_status, change.changed_by), ('pending', 'rejected', self.staff))
+
+    def test_bulk_complete_only_moves_approved_orders(self):
+        results = self.moderate('complete', self.pending[:1] + [self.approved])
+        self.assertEqual(results, {str(self.pending[0]): 'invalid_status', str(self.approved): 'completed'})
+        self.assertEqual(Order.objects.get(status='completed').id, self.approved)
+        self.assertIsNotNone(Order.objects.get(id=self.approved).completed_at)
+
+    def test_single_order_views_share_the_bulk_path(self):
+        response = self.client.get(reverse('reject_order', args=[self.pending[0]]))
+        self.assertRedirects(response, reverse('order_management'))
+        self.assertTrue(Order.objects.filter(id=self.pending[0], status='rejected').exists())
+        self.assertEqual(self.client.get(reverse('approve_order', args=[999999])).status_code, 404)
+
+
+class ProductCardCacheTests(TestCase):
+    client_class = PrimaryClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.product = Product.objects.create(
+            name='Phone', description='Test product', price=Decimal('1000'), category=get_categories()[0],
+        )
+
+    def setUp(self):
+        caches['fragments'].clear()
+        caches['pages'].clear()
+
+    def test_cards_are_served_from_the_fragment_cache(self):
+        self.assertContains(self.client.get(reverse('product_list')), '₦1,000')
+        # A queryset update skips save(), so the version and the cached card stay as they were
+        Product.objects.filter(id=self.product.id).update(price=Decimal('2000'))
+        self.assertContains(self.client.get(reverse('product_list')), '₦1,000')
+
+    def test_editing_a_product_bumps_its_version(self):
+        self.client.get(reverse('product_list'))
+        self.client.force_login(self.staff)
+        self.client.post(reverse('edit_product', args=[self.product.id]), {
+            'category': self.product.category_id, 'name': 'Phone', 'description': 'Test product',
+            'price': '2,500', 'stock': '5', 'discount_percentage': '0',
+        })
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.version, 2)
+        response = self.client.get(reverse('product_list'))
+        self.assertContains(response, '₦2,500')
+        self.assertNotContains(response, '₦1,000')
+
+
+class PageCacheTests(TestCase):
+    client_class = PrimaryClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.product = Product.objects.create(name='Phone', description='Test product', price=Decimal('1000'))
+
+    def setUp(self):
+        caches['pages'].clear()
+
+    def test_repeat_anonymous_hits_are_served_from_cache(self):
+        first = self.client.get(reverse('product_list'), {'search': 'Phone', 'min_price': '5'})
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        # Same filters in another order, plus a parameter the page ignores
+        second = self.client.get(reverse('product_list'), {'utm_source': 'mail', 'min_price': '5', 'search': 'Phone'})
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.content, first.content)
+
+    def test_echoed_search_is_cached_as_typed(self):
+        self.client.get(reverse('product_list'), {'search': 'Phone'})
+        for search in ('phone', ' Phone'):
+            response = self.client.get(reverse('product_list'), {'search': search})
+            self.assertEqual(response['X-Page-Cache'], 'MISS')
+            self.assertContains(response, f'name="search" value="{search}"')
+
+    def test_matching_etag_gets_304(self):
+        url = reverse('product_detail', args=[self.product.id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_product_change_purges_pages(self):
+        url = reverse('product_detail', args=[self.product.id])
+        self.client.get(url)
+        self.product.name = 'Tablet'
+        self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Tablet')
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('about'))
+        self.assertEqual(response['X-Page-Cache'], 'BYPASS')
+        self.assertFalse(response.has_header('ETag'))
+
+
+class CarouselTests(TestCase):
+
+    def setUp(self):
+        invalidate_slides()
+
+    def test_slides_are_built_once(self):
+        library.objects.create(title='Sale', description='Big sale', imagee='sample/sale')
+        with self.assertNumQueries(1):
+            slides = get_slides()
+        self.assertEqual(len(slides), 1)
+        self.assertIn('w_480', slides[0]['srcset'])
+        with self.assertNumQueries(0):
+            self.assertIs(get_slides(), slides)
+
+    def test_library_changes_rebuild_slides(self):
+        item = library.objects.create(title='Sale', description='Big sale', imagee='sample/sale')
+        get_slides()
+        item.delete()
+        self.assertEqual(get_slides(), [])
+
+    def test_slides_are_rebuilt_after_their_max_age(self):
+        library.objects.create(title='Sale', description='Big sale', imagee='sample/sale')
+        get_slides()
+        later = time.monotonic() + SLIDES_MAX_AGE + 1
+        with mock.patch('Mini_catalog.carousel.time.monotonic', return_value=later), self.assertNumQueries(1):
+            get_slides()
+
+    def test_per_process_default_cache_warns_with_several_workers(self):
+        self.assertEqual(check_default_cache(None), [])
+        with override_settings(WEB_CONCURRENCY=4):
+            self.assertEqual([warning.id for warning in check_default_cache(None)], ['Mini_catalog.W001'])
+
+    def test_dashboard_lists_rows_without_an_image(self):
+        item = library.objects.create(title='Draft', description='No image yet')
+        self.assertEqual(get_slides(), [])
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertContains(response, 'Draft')
+        self.assertContains(response, reverse('delete_carousel_image', args=[item.id]))
+
+
+def make_upload(width, height, name='photo.jpg'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGE_PIPELINE_WORKERS=0)
+class ImagePipelineTests(TestCase):
+    client_class = PrimaryClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Phone', description='Test product', price=Decimal('100'))
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        caches['pages'].clear()
+
+    def queue(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_derivatives(self.product, upload)
+        self.product.refresh_from_db()
+        return self.product.image_variants
+
+    def test_renders_every_size_and_format_after_commit(self):
+        variants = self.queue(make_upload(1200, 900))
+        self.assertEqual(variants['status'], 'ready')
+        self.assertEqual([source['type'] for source in variants['sources']], ['image/avif', 'image/webp'])
+        self.assertIn('160w', variants['sources'][0]['srcset'])
+        self.assertIn('1000w', variants['sources'][1]['srcset'])
+        self.assertEqual((variants['width'], variants['height']), (400, 300))
+        self.assertTrue(variants['placeholder'].startswith('data:image/webp;base64,'))
+        self.assertTrue(all(image_storage.exists(name) for name in variants['files']))
+        self.assertEqual(self.product.version, 2)
+
+    def test_small_images_are_not_upscaled(self):
+        variants = self.queue(make_upload(300, 300))
+        self.assertEqual(len(variants['files']), 4)  # 160 and 300 px, two formats each
+        self.assertIn(f"{variants['card']} 300w", variants['sources'][1]['srcset'])
+
+    def test_product_form_leaves_the_cloudinary_upload_to_the_pipeline(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        uploaded = CloudinaryResource('products/tablet', format='jpg', version=1, type='upload', resource_type='image')
+        with mock.patch('cloudinary.uploader.upload_resource', return_value=uploaded) as upload:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.client.post(reverse('add_product'), {
+                    'category': get_categories()[0].id, 'name': 'Tablet', 'description': 'New', 'price': '100',
+                    'stock': '1', 'discount_percentage': '0', 'image': make_upload(600, 400),
+                })
+            tablet = Product.objects.get(name='Tablet')
+            # The request only kept a local copy
+            self.assertFalse(upload.called)
+            self.assertEqual((tablet.image, tablet.image_variants['status']), (None, 'pending'))
+            for callback in callbacks:
+                callback()
+        upload.assert_called_once()
+        tablet.refresh_from_db()
+        self.assertEqual((tablet.image.public_id, tablet.image_variants['status']), ('products/tablet', 'ready'))
+
+    def test_detail_page_emits_srcset(self):
+        self.queue(make_upload(1200, 900))
+        response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertContains(response, '<source type="image/avif" srcset="')
+        self.assertContains(response, 'loading="lazy"')
+
+
+@override_settings(IMAGE_PIPELINE_WORKERS=0)
+class ProofUploadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.product = Product.objects.create(name='Phone', description='Test product', price=Decimal('100'), stock=100)
+
+    def setUp(self):
+        proof_root = tempfile.TemporaryDirectory()
+        self.addCleanup(proof_root.cleanup)
+        patcher = mock.patch.dict(proof_storage.__dict__, {'base_location': proof_root.name, 'location': proof_root.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.customer)
+
+    def checkout(self, upload):
+        cart, _ = Cart.objects.get_or_create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('checkout'), {'delivery_address': 'Lagos', 'proof_of_payment': upload})
+
+    @override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_STRICT=True)
+    def test_checkout_queries_do_not_grow_with_the_cart(self):
+        one_line = self.checkout(make_upload(200, 200, 'one.jpg'))
+        cases = Product.objects.bulk_create([
+            Product(name=f'Case {i}', description='Test product', price=Decimal('10'), stock=5) for i in range(49)
+        ])
+        for case in cases:
+            add_item(self.customer, case.id)
+        fifty_lines = self.checkout(make_upload(300, 200, 'fifty.jpg'))
+        self.assertRedirects(fifty_lines, reverse('order_history'), fetch_redirect_response=False)
+        self.assertEqual(fifty_lines['X-Query-Count'], one_line['X-Query-Count'])
+        self.assertEqual(OrderItem.objects.filter(order__checkout_token__isnull=False).count(), 51)
+        self.assertEqual(set(Product.objects.filter(name__startswith='Case').values_list('stock', flat=True)), {4})
+
+    def test_same_proof_is_stored_once_and_recompressed(self):
+        self.checkout(make_upload(2400, 1800, 'first.jpg'))
+        self.checkout(make_upload(2400, 1800, 'second.jpg'))
+        names = set(Order.objects.values_list('proof_of_payment', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(name.endswith('.webp'))
+        with proof_storage.open(name) as f:
+            self.assertEqual(max(Image.open(f).size), 2000)
+        self.assertEqual(proof_storage.listdir(name.rsplit('/', 1)[0])[1], [name.rsplit('/', 1)[1]])
+
+    def test_non_image_is_rejected(self):
+        upload = SimpleUploadedFile('proof.jpg', b'<?php echo 1; ?>', content_type='image/jpeg')
+        response = self.checkout(upload)
+        self.assertRedirects(response, reverse('checkout'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(PROOF_UPLOAD_MAX_BYTES=1024)
+    def test_oversized_proof_is_rejected(self):
+        response = self.checkout(make_upload(600, 600))
+        self.assertRedirects(response, reverse('checkout'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(proof_storage.listdir('')[0], [])
+
+    def test_blob_refcounts_follow_orders_and_gc_removes_unreferenced_files(self):
+        self.checkout(make_upload(400, 300))
+        self.checkout(make_upload(400, 300))
+        blob = MediaBlob.objects.get(storage='proofs')
+        self.assertEqual((blob.refcount, blob.size), (2, proof_storage.size(blob.name)))
+
+        Order.objects.first().delete()
+        self.assertEqual(MediaBlob.objects.get(pk=blob.pk).refcount, 1)
+        stats = collect_garbage([proof_storage], grace=timedelta(0))
+        self.assertEqual((stats['removed'], stats['saved_bytes']), (0, 0))
+
+        Order.objects.all().delete()
+        stats = collect_garbage([proof_storage], grace=timedelta(0))
+        self.assertEqual((stats['removed'], stats['removed_bytes']), (1, blob.size))
+        self.assertFalse(proof_storage.exists(blob.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+
+class SalesAnalyticsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        phones = Category.objects.create(name='Phones')
+        cls.phone = Product.objects.create(name='Phone', description='Test product', price=Decimal('100'), category=phones, stock=100)
+        cls.case = Product.objects.create(name='Case', description='Test product', price=Decimal('10'), stock=100)
+        cart = Cart.objects.create(user=cls.customer)
+        cls.order_ids = []
+        for quantity in (1, 2, 3):
+            CartItem.objects.create(cart=cart, product=cls.phone, quantity=quantity)
+            CartItem.objects.create(cart=cart, product=cls.case, quantity=1)
+            cls.order_ids.append(place_order(cls.customer, 'Lagos', None, uuid.uuid4()).id)
+        moderate_orders(cls.order_ids[:2], 'approve')
+        moderate_orders(cls.order_ids[2:], 'reject')
+        moderate_orders(cls.order_ids[:2], 'complete')
+
+    def rollups(self):
+        return (
+            list(DailySales.objects.values_list(
+                'date', 'orders_placed', 'placed_amount', 'orders_approved', 'orders_rejected', 'orders_completed',
+                'revenue', 'units_sold',
+            )),
+            list(DailyProductSales.objects.order_by('product').values_list('date', 'product', 'units', 'revenue')),
+        )
+
+    def test_transitions_update_the_daily_rollups(self):
+        today = timezone.localdate()
+        day = DailySales.objects.get(date=today)
+        self.assertEqual(
+            (day.orders_placed, day.orders_approved, day.orders_rejected, day.orders_completed), (3, 2, 1, 2),
+        )
+        self.assertEqual((day.revenue, day.units_sold, day.average_order_value), (Decimal('320'), 5, Decimal('160')))
+        self.assertEqual(self.rollups()[1], [(today, self.phone.id, 3, Decimal('300')), (today, self.case.id, 2, Decimal('20'))])
+
+    def test_backfill_rebuilds_the_same_rollups(self):
+        incremental = self.rollups()
+        DailySales.objects.update(revenue=0)
+        DailyProductSales.objects.all().delete()
+        call_command('backfill_analytics', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_dashboard_reads_only_rollups(self):
+        with CaptureQueriesContext(connection) as queries:
+            sales = dashboard_summary()
+        self.assertFalse([query['sql'] for query in queries if '"Mini_catalog_order' in query['sql']])
+        self.assertEqual(sales['completion_rate'], 67)
+        self.assertEqual([category['share'] for category in sales['categories']], [94, 6])
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse('admin_dashboard')), '₦320')
+
+    def test_completed_order_count_does_not_wait_for_a_backfill(self):
+        DailySales.objects.all().delete()
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_orders'], 2)
+
+
+class AdminUserTableTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        User.objects.bulk_create([
+            User(username=f'Customer{i:03}', email=f'buyer{i:03}@example.com', is_active=i % 10 != 0)
+            for i in range(120)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def fetch(self, query=''):
+        response = self.client.get(reverse('admin_users') + query, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_json_pages_follow_the_cursor(self):
+        first = self.fetch()
+        self.assertEqual(len(first['results']), 50)
+        second = self.fetch(f"?after={first['next_cursor']}")
+        self.assertEqual(second['results'][0]['id'], first['results'][-1]['id'] + 1)
+        self.assertEqual(second['previous_cursor'], second['results'][0]['id'])
+        self.assertNotIn('password', second['results'][0])
+
+    def test_search_matches_username_or_email_prefix_case_insensitively(self):
+        self.assertEqual([row['username'] for row in self.fetch('?search=customer11')['results']][:2], ['Customer110', 'Customer111'])
+        self.assertEqual(len(self.fetch('?search=BUYER00')['results']), 10)
+        self.assertEqual(self.fetch('?search=buyer001@')['results'][0]['username'], 'Customer001')
+        self.assertEqual(self.fetch('?search=example')['results'], [])
+
+    def test_staff_and_active_filters(self):
+        self.assertEqual([row['username'] for row in self.fetch('?staff=yes')['results']], ['staff'])
+        inactive = self.fetch('?active=no&staff=no')['results']
+        self.assertEqual(len(inactive), 12)
+        self.assertFalse(any(row['is_active'] for row in inactive))
+
+    def test_dashboard_renders_one_page(self):
+        response = self.client.get(reverse('admin_dashboard') + '?search=cust')
+        self.assertEqual(len(response.context['users']), 50)
+        self.assertContains(response, 'Customer049')
+        self.assertNotContains(response, 'Customer050')
+        self.assertIn('after=', response.context['next_query'])
+
+
+class ProductImportExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.category = get_categories()[0]
+        cls.product = Product.objects.create(
+            name='Phone', description='Test product', price=Decimal('1000'), category=cls.category,
+        )
+
+    def run_import(self, text, fmt='csv', **kwargs):
+        return import_products(read_rows(StringIO(text), fmt), **kwargs)
+
+    def test_csv_rows_create_and_update_products(self):
+        report = self.run_import(
+            'id,name,description,price,discount_percentage,stock,category\n'
+            f'{self.product.id},Phone X,Updated,"2,500",10,0,{self.category.name.upper()}\n'
+            ',Tablet,New,"1,000.50",0,"1,200",\n'
+            ',Broken,Bad price,abc,0,5,\n'
+            ',Lost,Unknown category,5,0,5,Nowhere\n'
+            '99999,Ghost,Missing id,5,0,5,\n',
+            chunk_size=2,
+        )
+        self.assertEqual((report.rows, report.created, report.updated, report.error_count), (5, 1, 1, 3))
+        self.assertEqual([line for line, _ in report.errors], [4, 5, 6])
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.price, self.product.in_stock), ('Phone X', Decimal('2500'), False))
+        # Cached cards are keyed on the version, so a bulk update must still bump it
+        self.assertEqual(self.product.version, 2)
+        tablet = Product.objects.get(name='Tablet')
+        self.assertEqual((tablet.price, tablet.stock, tablet.category_id, tablet.version), (Decimal('1000.50'), 1200, None, 1))
+        self.assertEqual([product.name for product in search_products(Product.objects.all(), 'tablet')], ['Tablet'])
+
+    def test_updates_only_write_the_columns_in_the_file(self):
+        Product.objects.filter(id=self.product.id).update(stock=7, discount_percentage=Decimal('15'))
+        report = self.run_import(f'id,name,price\n{self.product.id},Phone X,"2,500"\n')
+        self.assertEqual((report.updated, report.error_count), (1, 0))
+        self.product.refresh_from_db()
+        self.assertEqual(
+            (self.product.name, self.product.price, self.product.description, self.product.stock,
+             self.product.discount_percentage, self.product.category_id),
+            ('Phone X', Decimal('2500'), 'Test product', 7, Decimal('15'), self.category.id),
+        )
+
+        report = self.run_import(f'{{"id": {self.product.id}, "stock": 3}}\n{{"id": {self.product.id}}}\n', fmt='jsonl')
+        self.assertEqual((report.updated, report.errors), (1, [(2, 'No product columns to update.')]))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock), ('Phone X', 3))
+
+    def test_dry_run_writes_nothing(self):
+        report = self.run_import('{"name": "Tablet", "price": "1,000"}\nnot json\n', fmt='jsonl', dry_run=True)
+        self.assertEqual((report.rows, report.created, report.error_count), (2, 0, 1))
+        self.assertFalse(Product.objects.filter(name='Tablet').exists())
+
+    def test_export_round_trips_through_import(self):
+        exported = ''.join(serialize_rows(export_rows(), 'jsonl'))
+        self.assertEqual(json.loads(exported)['category'], self.category.name)
+        report = self.run_import(exported, fmt='jsonl')
+        self.assertEqual((report.updated, report.error_count), (1, 0))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.category_id), (Decimal('1000'), self.category.id))
+
+    def test_admin_views_import_upload_and_stream_export(self):
+        self.client.force_login(self.staff)
+        upload = SimpleUploadedFile('products.csv', b'\xef\xbb\xbfname,price,category\nTablet,"1,000",\n', 'text/csv')
+        response = self.client.post(reverse('import_products'), {'file': upload})
+        self.assertEqual(response.context['report'].created, 1)
+
+        response = self.client.get(reverse('export_products'))
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,description,price,discount_percentage,stock,category')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('Tablet,,1000.00,0.00,0,', lines[2])
+
+    def test_import_command_reports_throughput(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('name,price\nTablet,"1,000"\n')
+        out = StringIO()
+        call_command('import_products', f.name, stdout=out)
+        self.assertIn('1 created', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+
+
+class RatingsJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = get_categories()[0]
+        cls.products = [
+            Product.objects.create(name=f'Phone {i}', description='Test product', price=Decimal('1000'), category=category)
+            for i in range(5)
+        ]
+
+    def test_only_changed_ratings_are_written_in_chunks(self):
+        first, second, *rest = self.products
+        Product.objects.filter(pk=second.pk).update(rating=Decimal('4.5'), num_ratings=20)
+        chunks = []
+        stats = recompute_ratings(
+            lambda ids: {pk: (4.5, 20) for pk in ids if pk != first.pk}, chunk_size=2,
+            progress=lambda stats: chunks.append(dict(stats)),
+        )
+        self.assertEqual(stats, {'products': 5, 'changed': 3})
+        self.assertEqual(len(chunks), 3)
+
+        ratings = dict(Product.objects.values_list('pk', 'rating'))
+        versions = dict(Product.objects.values_list('pk', 'version'))
+        self.assertEqual(ratings[first.pk], Decimal('0'))
+        self.assertEqual(ratings[rest[0].pk], Decimal('4.5'))
+        # Cached cards show the stars, so rewritten products move to a new version
+        self.assertEqual(versions[first.pk], 1)
+        self.assertEqual(versions[second.pk], 1)
+        self.assertEqual(versions[rest[0].pk], 2)
+
+    def test_dry_run_and_command(self):
+        stats = recompute_ratings(lambda ids: {pk: (5, 10) for pk in ids}, dry_run=True)
+        self.assertEqual(stats['changed'], 5)
+        self.assertFalse(Product.objects.exclude(rating=0).exists())
+
+        out = StringIO()
+        call_command('update_ratings', '--seed', '1', '--chunk-size', '2', stdout=out)
+        self.assertIn('Updated ratings of 5 of 5 products', out.getvalue())
+        self.assertEqual(Product.objects.filter(rating__gte=3, num_ratings__gte=10).count(), 5)
+
+
+def hammer(work, threads=8, rounds=25):
+    """Run ``work(thread, round)`` from many threads at once and re-raise the first error."""
+    barrier = threading.Barrier(threads)
+    errors = []
+
+    def run(thread):
+        try:
+            barrier.wait()
+            for round_ in range(rounds):
+                work(thread, round_)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=run, args=(thread,)) for thread in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+
+
+class CartConcurrencyTests(TransactionTestCase):
+    # Threads need committed data, and the flush between tests would drop the bootstrapped categories
+    serialized_rollback = True
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass')
+        category = get_categories()[0]
+        self.products = [
+            Product.objects.create(name=f'Phone {i}', description='Test product', price=Decimal('1000'), category=category)
+            for i in range(3)
+        ]
+
+    def test_concurrent_adds_are_all_counted_on_one_line(self):
+        hammer(lambda thread, round_: add_item(self.user, self.products[round_ % 3].id))
+        quantities = dict(CartItem.objects.values_list('product_id', 'quantity'))
+        # 8 threads x 25 adds, spread over three products
+        self.assertEqual(quantities, {self.products[0].id: 72, self.products[1].id: 64, self.products[2].id: 64})
+
+    def test_concurrent_increments_and_decrements_balance_out(self):
+        add_item(self.user, self.products[0].id, quantity=50)
+        item = CartItem.objects.get()
+        hammer(lambda thread, round_: change_quantity(self.user, item.id, 1 if thread % 2 else -1))
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 50)
+
+    def test_decrements_stop_at_one(self):
+        add_item(self.user, self.products[0].id, quantity=10)
+        item = CartItem.objects.get()
+        hammer(lambda thread, round_: change_quantity(self.user, item.id, -1))
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+
+
+class StockReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass')
+        category = get_categories()[0]
+        cls.phone = Product.objects.create(name='Phone', description='Test product', price=Decimal('100'), category=category, stock=3)
+        cls.case = Product.objects.create(name='Case', description='Test product', price=Decimal('10'), category=category, stock=5)
+
+    def checkout(self, **quantities):
+        for name, quantity in quantities.items():
+            add_item(self.buyer, getattr(self, name).id, quantity)
+        return place_order(self.buyer, '1 Main St', None, uuid.uuid4())
+
+    def test_checkout_reserves_stock_and_rejection_releases_it(self):
+        order = self.checkout(phone=3, case=1)
+        self.phone.refresh_from_db()
+        self.assertEqual((self.phone.stock, self.phone.in_stock), (0, False))
+        # Cached cards show "In Stock", so selling out moves to a new version
+        self.assertEqual(self.phone.version, 2)
+
+        moderate_orders([order.id], 'reject')
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Phone': 3, 'Case': 5})
+        order.refresh_from_db()
+        self.assertFalse(order.stock_reserved)
+
+    def test_short_line_rolls_back_the_whole_checkout(self):
+        with self.assertRaisesMessage(CheckoutError, 'Not enough stock left for: Phone'):
+            self.checkout(case=2, phone=4)
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Phone': 3, 'Case': 5})
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_sold_out_products_cannot_be_added_to_the_cart(self):
+        Product.objects.filter(id=self.phone.id).update(stock=0)
+        self.client.force_login(self.buyer)
+        self.client.get(reverse('add_to_cart', args=[self.phone.id]))
+        self.assertFalse(CartItem.objects.exists())
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    serialized_rollback = True
+    # 40 buyers for 10 units keeps the default run fast; STOCK_RACE_BUYERS=1000
+    # runs the full flash sale of 1000 buyers for 100 units, one thread each.
+    # On SQLite the last of 1000 writers can queue past the default 20s busy
+    # timeout, so run that with SQLITE_BUSY_TIMEOUT=60.
+    BUYERS = int(os.environ.get('STOCK_RACE_BUYERS', 40))
+
+    def test_concurrent_buyers_never_oversell(self):
+        units = self.BUYERS // 10
+        product = Product.objects.create(name='Phone', description='Flash sale', price=Decimal('100'), stock=units)
+        buyers = [User.objects.create_user(f'buyer{i}') for i in range(self.BUYERS)]
+        for buyer in buyers:
+            add_item(buyer, product.id)
+        outcomes = []
+
+        def buy(thread, round_):
+            try:
+                place_order(buyers[thread], '1 Main St', None, uuid.uuid4())
+                outcomes.append('bought')
+            except CheckoutError:
+                outcomes.append('sold out')
+
+        hammer(buy, threads=self.BUYERS, rounds=1)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(outcomes.count('bought'), units)
+        self.assertEqual(outcomes.count('sold out'), self.BUYERS - units)
+        self.assertEqual(OrderItem.objects.aggregate(units=Sum('quantity'))['units'], units)
+
+
+class CheckoutTransactionTests(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass')
+        category = get_categories()[0]
+        self.phone = Product.objects.create(name='Phone', description='Test product', price=Decimal('100'), category=category, stock=3)
+        self.case = Product.objects.create(name='Case', description='Test product', price=Decimal('10'), category=category, stock=5)
+        add_item(self.buyer, self.phone.id, 2)
+        add_item(self.buyer, self.case.id)
+        self.token = uuid.uuid4()
+
+    def assertNothingPlaced(self):
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(dict(CartItem.objects.values_list('product__name', 'quantity')), {'Phone': 2, 'Case': 1})
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Phone': 3, 'Case': 5})
+
+    def test_double_submit_returns_the_first_order(self):
+        order = place_order(self.buyer, '1 Main St', None, self.token)
+        self.assertEqual(place_order(self.buyer, '1 Main St', None, self.token), order)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Phone': 1, 'Case': 4})
+
+    def test_concurrent_double_submits_resolve_to_one_order(self):
+        orders = []
+        hammer(lambda thread, round_: orders.append(place_order(self.buyer, '1 Main St', None, self.token)), rounds=1)
+        self.assertEqual({order.id for order in orders}, set(Order.objects.values_list('id', flat=True)))
+        self.assertEqual(len(orders), 8)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Phone': 1, 'Case': 4})
+
+    def test_token_collision_returns_the_order_that_won(self):
+        # The other submit commits between this one's token lookup and its insert
+        winner = []
+        first = QuerySet.first
+
+        def lookup_then_lose_the_race(queryset):
+            if queryset.model is Order and not winner:
+                winner.append(Order.objects.create(user=self.buyer, total_amount=Decimal('210'), checkout_token=self.token))
+                return None
+            return first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', autospec=True, side_effect=lookup_then_lose_the_race):
+            order = place_order(self.buyer, '1 Main St', None, self.token)
+        self.assertEqual(order, winner[0])
+        self.assertEqual(Order.objects.count(), 1)
+        # The losing submit's reservations and order lines were rolled back
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Phone': 3, 'Case': 5})
+
+    def test_failure_partway_leaves_no_partial_order(self):
+        with mock.patch('Mini_catalog.orders.record_order_placed', side_effect=RuntimeError('rollup failed')):
+            with self.assertRaisesMessage(RuntimeError, 'rollup failed'):
+                place_order(self.buyer, '1 Main St', None, self.token)
+        self.assertNothingPlaced()
+
+    def test_bench_checkout_reports_and_cleans_up(self):
+        out = StringIO()
+        call_command('bench_checkout', '--buyers', '6', '--threads', '3', '--lines', '3', '--double-submit', '--force', stdout=out)
+        self.assertIn('12 checkouts', out.getvalue())
+        self.assertIn('6 orders, 0 partial, 0 buyers with duplicate orders', out.getvalue())
+        self.assertIn('Stock, orders and carts are consistent', out.getvalue())
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(set(Product.objects.values_list('name', flat=True)), {'Phone', 'Case'})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'checks the SQLite connection settings')
+class SQLiteConnectionTests(TestCase):
+
+    def test_new_connections_apply_the_configured_pragmas(self):
+        options = settings.DATABASES['default']['OPTIONS']
+        fresh = connections.create_connection('default')
+        self.addCleanup(fresh.close)
+        with fresh.cursor() as cursor:
+            pragmas = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        # PRAGMA synchronous reports the level as a number
+        levels = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+        self.assertEqual(pragmas['synchronous'], levels[settings.SQLITE_PRAGMAS['synchronous'].upper()])
+        self.assertEqual(pragmas['busy_timeout'], options['timeout'] * 1000)
+        self.assertEqual(fresh.transaction_mode, 'IMMEDIATE')
+
+
+class SessionTests(TestCase):
+    client_class = PrimaryClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass')
+        cls.phone = Product.objects.create(name='Phone', description='Test product', price=Decimal('100'), stock=5)
+
+    # The test run is a single process, so its local memory session cache is shared
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cached_sessions_keep_logged_in_browsing_off_the_session_table(self):
+        self.client.login(username='buyer', password='pass')
+        for url in [reverse('product_list'), reverse('add_to_cart', args=[self.phone.id]), reverse('view_cart')]:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url, follow=True)
+            self.assertFalse([query for query in queries if 'django_session' in query['sql']], url)
+
+    def test_sessions_are_only_cached_in_a_shared_cache(self):
+        if not settings.SESSION_CACHE_SHARED:
+            self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+        self.assertEqual(check_session_cache(None), [])
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db'):
+            self.assertEqual([error.id for error in check_session_cache(None)], ['Mini_catalog.E001'])
+
+    def test_flash_messages_travel_in_a_cookie(self):
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('add_to_cart', args=[self.phone.id]))
+        self.assertIn('messages', response.cookies)
+        self.assertContains(self.client.get(response.url), 'Phone added to cart!')
+
+    def test_cleanup_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'old{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(7)]
+            + [Session(session_key=f'live{i}', session_data='', expire_date=now + timedelta(days=1)) for i in range(2)]
+        )
+        self.assertEqual(clear_expired_sessions(dry_run=True), 7)
+        batches = []
+        self.assertEqual(clear_expired_sessions(chunk_size=3, progress=batches.append), 7)
+        self.assertEqual(batches, [3, 6, 7])
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)), ['live0', 'live1'])
+
+        out = StringIO()
+        call_command('clear_expired_sessions', stdout=out)
+        self.assertIn('Deleted 0 expired sessions', out.getvalue())
+
+
+# DB_REPLICA_NAME=replica.sqlite3 python manage.py test Mini_catalog.tests.ReplicaRoutingTests
+needs_replica = skipUnless(replica_configured(), 'needs DB_REPLICA_NAME to add a replica database')
+
+
+class ReplicaRoutingTests(TestCase):
+    """Rows written only to the primary stand in for writes the replica has not caught up with."""
+    databases = {'default', REPLICA_ALIAS} if replica_configured() else {'default'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass')
+        cls.phone = Product.objects.create(name='Phone', description='Test product', price=Decimal('100'), stock=5)
+        cls.tablet = Product.objects.create(name='Tablet', description='Test product', price=Decimal('300'), stock=5)
+        if replica_configured():
+            User.objects.db_manager(REPLICA_ALIAS).create_user('buyer', 'buyer@example.com', 'pass', id=cls.buyer.id)
+            Product.objects.using(REPLICA_ALIAS).create(
+                id=cls.phone.id, name='Phone', description='Test product', price=Decimal('100'), stock=5,
+            )
+
+    def setUp(self):
+        caches['fragments'].clear()
+        caches['pages'].clear()
+
+    @needs_replica
+    def test_catalog_reads_come_from_the_replica(self):
+        self.assertEqual(self.client.get(reverse('product_detail', args=[self.phone.id])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('product_detail', args=[self.tablet.id])).status_code, 404)
+
+    @needs_replica
+    def test_a_write_pins_the_browser_to_the_primary(self):
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('add_to_cart', args=[self.tablet.id]))
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(reverse('product_detail', args=[self.tablet.id])).status_code, 200)
+
+    @needs_replica
+    def test_order_history_shows_new_orders_once_pinned(self):
+        order = Order.objects.create(user=self.buyer, total_amount=Decimal('100'), status='approved')
+        self.client.force_login(self.buyer)
+        self.assertEqual(list(self.client.get(reverse('order_history')).context['orders']), [])
+        self.client.cookies[REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(list(self.client.get(reverse('order_history')).context['orders']), [order])
+
+    @needs_replica
+    def test_objects_read_from_the_replica_are_saved_to_the_primary(self):
+        product = Product.objects.using(REPLICA_ALIAS).get(id=self.phone.id)
+        product.name = 'Phone 2'
+        product.save()
+        self.assertEqual(Product.objects.get(id=self.phone.id).name, 'Phone 2')
+        self.assertEqual(Product.objects.using(REPLICA_ALIAS).get(id=self.phone.id).name, 'Phone')
+
+    @needs_replica
+    def test_pages_read_from_the_replica_right_after_a_purge_are_not_cached(self):
+        purge_pages()
+        self.assertEqual(self.client.get(reverse('product_list'))['X-Page-Cache'], 'BYPASS')
+        with override_settings(DB_REPLICA_PIN_SECONDS=0):
+            self.assertEqual(self.client.get(reverse('product_list'))['X-Page-Cache'], 'MISS')
+
+    @skipUnless(not replica_configured(), 'checks the single database setup')
+    def test_without_a_replica_everything_uses_the_primary(self):
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('add_to_cart', args=[self.tablet.id]))
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(reverse('product_detail', args=[self.tablet.id])).status_code, 200)
@@ -0,0 +1,152 @@
+import hashlib
+import os
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .images import run_in_background
+from .models import Order, proof_storage
+
+# Form field handled by ProofUploadHandler; every other file passes through
+PROOF_FIELD = 'proof_of_payment'
+
+# Room left in the request body for the checkout form's other fields
+PROOF_FORM_OVERHEAD = 64 * 1024
+
+# Recompressed proofs are scaled down to fit this many pixels on the long edge
+PROOF_MAX_DIMENSION = 2000
+
+# Leading bytes of each accepted image format and the extension it is stored with
+_SIGNATURES = [
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+]
+
+
+def sniff_image_extension(head):
+    """Return the extension for the image format ``head`` starts with, or None."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+class ProofUploadHandler(FileUploadHandler):
+    """
+    Streams the proof of payment to a temporary file on disk chunk by chunk,
+    hashing it on the way, and skips it as soon as it is known to be too
+    large or not an image, without reading the rest into memory.
+
+    The reason a proof was skipped is left in ``request.proof_upload_error``.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.content_length = content_length
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = field_name == PROOF_FIELD
+        if not self.active:
+            return
+        self.size = 0
+        self.extension = None
+        self.sha256 = hashlib.sha256()
+        if self.content_type not in settings.PROOF_UPLOAD_CONTENT_TYPES:
+            self._reject('Proof of payment must be a JPEG, PNG, WebP or GIF image.')
+        if (self.content_length or 0) > settings.PROOF_UPLOAD_MAX_BYTES + PROOF_FORM_OVERHEAD:
+            self._reject_too_large()
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        # The default handlers would keep their own copy of this file
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if start == 0:
+            self.extension = sniff_image_extension(raw_data[:16])
+            if self.extension is None:
+                self._reject('Proof of payment must be a JPEG, PNG, WebP or GIF image.')
+        self.size += len(raw_data)
+        if self.size > settings.PROOF_UPLOAD_MAX_BYTES:
+            self._reject_too_large()
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        self.file.extension = self.extension
+        return self.file
+
+    def _reject(self, message):
+        self.request.proof_upload_error = message
+        raise SkipFile()
+
+    def _reject_too_large(self):
+        limit = settings.PROOF_UPLOAD_MAX_BYTES // (1024 * 1024)
+        self._reject(f'Proof of payment must be smaller than {limit} MB.')
+
+
+def store_proof(upload):
+    """
+    Save an uploaded proof and return the stored name. Proof storage is
+    content addressed, so a proof uploaded before is not written again and
+    orders paid with the same image share one file (its recompressed copy,
+    once there is one). New files are recompressed in the background once
+    the current transaction commits, so call this inside the transaction
+    that creates the order.
+    """
+    # Name it after the format ProofUploadHandler sniffed rather than what the client claimed
+    extension = getattr(upload, 'extension', None) or os.path.splitext(upload.name)[1]
+    name, created = proof_storage.store(f'proofs/proof{extension}', upload)
+    if created and not name.endswith('.webp'):
+        transaction.on_commit(partial(run_in_background, recompress_proof, name))
+    return name
+
+
+def recompress_proof(name):
+    """
+    Re-encode a stored proof as WebP scaled to PROOF_MAX_DIMENSION. If that
+    is smaller, it replaces the original in proof storage and orders are
+    pointed at it. Returns the name orders should use.
+    """
+    with proof_storage.open(name) as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    image.thumbnail((PROOF_MAX_DIMENSION, PROOF_MAX_DIMENSION), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, 'webp', quality=85, method=4)
+    if buffer.tell() >= proof_storage.size(name):
+        return name
+
+    with transaction.atomic():
+        # Updating the blob takes the write lock first, so a checkout storing
+        # the same proof either commits before this (and is repointed here)
+        # or starts after it and gets the .webp name
+        webp_name = proof_storage.replace(name, ContentFile(buffer.getvalue()), '.webp')
+        Order.objects.filter(proof_of_payment=name).update(proof_of_payment=webp_name)
+    proof_storage.remove(name)
+    return webp_name
+
+
+def release_proof(sender, instance, **kwargs):
+    """Drop a deleted order's reference to its proof (used as a post_delete receiver)."""
+    if instance.proof_of_payment:
+        proof_storage.delete(instance.proof_of_payment.name)
@@ -19,10 +19,14 @@ urlpatterns = [
     path("edit/<int:product_id>/", views.edit_product, name="edit_product"),
     path("checkout/", views.checkout, name="checkout"),
     path("dashboard/", views.admin_dashboard, name="admin_dashboard"),
+    path("dashboard/users/", views.admin_users, name="admin_users"),
+    path("products/import/", views.import_products_view, name="import_products"),
+    path("products/export/", views.export_products_view, name="export_products"),
     path("orders/", views.order_management, name="order_management"),
     path("orders/approve/<int:order_id>/", views.approve_order, name="approve_order"),
     path("orders/reject/<int:order_id>/", views.reject_order, name="reject_order"),
     path("orders/complete/<int:order_id>/", views.complete_order, name="complete_order"),
+    path("orders/bulk/", views.bulk_moderate_orders, name="bulk_moderate_orders"),
     path("contact-messages/", views.contact_messages, name="contact_messages"),
     path("completed-orders/", views.completed_orders, name="completed_orders"),
     path("rejected-orders/", views.rejected_orders, name="rejected_orders"),
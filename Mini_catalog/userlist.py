@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+# Rows in each page of the admin dashboard's user table
+USER_PAGE_SIZE = 50
+
+# Columns the user table shows; the password hash and the rest are never loaded
+USER_FIELDS = ['id', 'username', 'email', 'first_name', 'last_name', 'is_staff', 'is_active', 'date_joined']
+
+# Sorts after any character a username or email can contain
+_PREFIX_END = '\U0010ffff'
+
+
+def _prefix(field, term):
+    # A range on LOWER(field) rather than LIKE, so the expression indexes from
+    # migration 0026_user_search_indexes can serve it
+    return Q(**{f'{field}_lower__gte': term, f'{field}_lower__lt': term + _PREFIX_END})
+
+
+def filter_users(params):
+    """
+    The users matching the dashboard's query string: ``search`` is a
+    case-insensitive prefix of the username or email (only the email once
+    it contains an @), ``staff`` and ``active`` are 'yes' or 'no'.
+    """
+    users = User.objects.only(*USER_FIELDS)
+    search = params.get('search', '').strip().lower()
+    if search:
+        users = users.alias(username_lower=Lower('username'), email_lower=Lower('email'))
+        match = _prefix('email', search)
+        if '@' not in search:
+            match |= _prefix('username', search)
+        users = users.filter(match)
+    for param, field in (('staff', 'is_staff'), ('active', 'is_active')):
+        if params.get(param) in ('yes', 'no'):
+            users = users.filter(**{field: params[param] == 'yes'})
+    return users
+
+
+def user_row(user):
+    """A user as the JSON endpoint returns it."""
+    row = {field: getattr(user, field) for field in USER_FIELDS}
+    row['date_joined'] = user.date_joined.isoformat()
+    return row
@@ -1,28 +1,44 @@
+import io
+import os
+import uuid
+
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from .models import library
-from .models import Category, Product, Cart, CartItem, Order, OrderItem, ContactMessage, CompletedOrder, RejectedOrder, InboxMessage, Wishlist, WishlistItem
+from .models import Category, Product, CartItem, Order, ContactMessage, InboxMessage, Wishlist, WishlistItem
 from .forms import ProductForm, AdminUserCreationForm, LibraryForm
+from .categories import get_categories
+from .carousel import get_slides
+from .images import queue_derivatives
+from .search import search_products
+from .pagination import keyset_page, list_page, parse_cursor
+from .querybudget import query_budget
+from .pagecache import PAGE_CACHE_PARAMS, cache_anonymous_page
+from .routing import replica_reads
+from .cart import add_item, cart_totals, change_quantity, get_cart_items, invalidate_cart_summary
+from .orders import MODERATION_ACTIONS, CheckoutError, moderate_orders, place_order
+from .analytics import dashboard_summary
+from .userlist import USER_PAGE_SIZE, filter_users, user_row
+from .product_io import PRODUCT_FORMATS, export_rows, import_products, read_rows, serialize_rows
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth import logout as auth_logout
 
-def product_list(request):
-
-    # Imports all the photos and save it in the database
-
-    photo = library.objects.all()
+# Number of cards in each promo section on the homepage
+PROMO_SECTION_SIZE = 12
 
-    cloudinary_img = {'photo':photo}
+@replica_reads
+@cache_anonymous_page
+@query_budget(10)
+def product_list(request):
 
-    # Ensure only Luxury and Affordable categories exist
-    Category.objects.get_or_create(name='Luxury')
-    Category.objects.get_or_create(name='Affordable')
-    # Remove any unwanted categories
-    Category.objects.exclude(name__in=['Luxury', 'Affordable']).delete()
+    # Carousel slides with their Cloudinary URLs are built once per process
+    photo = get_slides()
 
-    categories = Category.objects.all()
+    # Categories are bootstrapped by a migration and cached per process
+    categories = get_categories()
     category_id = request.GET.get('category')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
@@ -40,12 +56,33 @@ def product_list(request):
         products = products.filter(price__gte=min_price)
     if max_price:
         products = products.filter(price__lte=max_price)
+
+    after = parse_cursor(request.GET.get('after'))
+    before = parse_cursor(request.GET.get('before'))
     if search:
-        products = products.filter(name__icontains=search) | products.filter(description__icontains=search)
+        # Ranked full-text search; returns a list with highlighted snippets
+        matches = search_products(products, search)
+        page = list_page(matches, after=after, before=before)
+        # The promo sections only offer products the search found
+        products = products.filter(pk__in=[product.pk for product in matches])
+    else:
+        page = keyset_page(products, after=after, before=before)
+
+    # Promo sections are small bounded queries of their own rather than
+    # filters over the full catalog in the template
+    discounted = products.filter(discount_percentage__gt=0).order_by('-discount_percentage', '-id')
+    amazing_discounts = discounted[:PROMO_SECTION_SIZE]
+    clearance_sales = discounted.filter(discount_percentage__gte=50)[:PROMO_SECTION_SIZE]
+    bogo_offers = products.filter(price__gte=20, price__lte=100).order_by('price', 'id')[:PROMO_SECTION_SIZE]
 
     return render(request, "home.html", {
         "photo": photo,
-        "products": products,
+        "products": page,
+        "amazing_discounts": amazing_discounts,
+        "clearance_sales": clearance_sales,
+        "bogo_offers": bogo_offers,
+        "next_query": _page_query(request, after=page.next_cursor) if page.has_next else None,
+        "previous_query": _page_query(request, before=page.previous_cursor) if page.has_previous else None,
         "categories": categories,
         "selected_category": category_id,
         "min_price": min_price,
@@ -53,19 +90,30 @@ def product_list(request):
         "search": search,
     })
 
+def _page_query(request, **cursor):
+    # Keep the current filters and swap in the new page cursor. Other parameters
+    # are dropped, since the page cache serves these links to every visitor.
+    query = request.GET.copy()
+    for name in list(query):
+        if name not in PAGE_CACHE_PARAMS or name in ('after', 'before'):
+            del query[name]
+    query.update(cursor)
+    return query.urlencode()
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def add_product(request):
-    # Ensure only Luxury and Affordable categories exist
-    Category.objects.get_or_create(name='Luxury')
-    Category.objects.get_or_create(name='Affordable')
-    # Remove any unwanted categories
-    Category.objects.exclude(name__in=['Luxury', 'Affordable']).delete()
-
     if request.method == 'POST':
-        form = ProductForm(request.POST)
+        form = ProductForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
+            product = form.save(commit=False)
+            upload = request.FILES.get('image')
+            if upload:
+                # The image pipeline sends the original to Cloudinary after the response
+                product.image = None
+            product.save()
+            if upload:
+                queue_derivatives(product, upload, upload_field='image')
             messages.success(request, 'Product added successfully!')
             return redirect('product_list')
     else:
@@ -86,15 +134,25 @@ def edit_product(request, product_id):
     product = get_object_or_404(Product, id=product_id)
 
     if request.method == 'POST':
-        form = ProductForm(request.POST, instance=product)
+        form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
-            form.save()
+            product = form.save(commit=False)
+            upload = request.FILES.get('image')
+            # Checkouts change stock concurrently, so only write it when staff changed it.
+            # A new image is left to the image pipeline, which uploads it after the response.
+            product.save(update_fields=[
+                name for name in form.Meta.fields
+                if (name != 'stock' or 'stock' in form.changed_data) and not (name == 'image' and upload)
+            ])
+            if upload:
+                queue_derivatives(product, upload, upload_field='image')
             messages.success(request, 'Product updated successfully!')
             return redirect('product_list')
     else:
         form = ProductForm(instance=product)
     return render(request, 'edit_product.html', {'form': form, 'product': product})
 
+@cache_anonymous_page
 def about(request):
     return render(request, 'about.html')
 
@@ -132,40 +190,35 @@ def register(request):
 @login_required
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    if not product.in_stock:
+        messages.error(request, f'{product.name} is out of stock.')
+        return redirect('product_list')
+    add_item(request.user, product.id)
+    invalidate_cart_summary(request.user)
     messages.success(request, f'{product.name} added to cart!')
     return redirect('product_list')
 
 @login_required
+@query_budget(8)
 def view_cart(request):
-    cart = Cart.objects.filter(user=request.user).first()
-    if cart:
-        items = cart.cartitem_set.all()
-        total = sum(item.total_price() for item in items)
-    else:
-        items = []
-        total = 0
+    items = get_cart_items(request.user)
+    total = cart_totals(request.user)['total']
     return render(request, 'cart.html', {'items': items, 'total': total})
 
 @login_required
+@query_budget(20)
 def checkout(request):
-    cart = Cart.objects.filter(user=request.user).first()
-    if not cart or not cart.cartitem_set.exists():
-        messages.warning(request, "Your cart is empty. Add items before checking out.")
-        return redirect('view_cart')
-
-    items = cart.cartitem_set.all()
-    total = sum(item.total_price() for item in items)
-
     if request.method == 'POST':
         # Process the checkout
         delivery_address = request.POST.get('delivery_address')
         proof_of_payment = request.FILES.get('proof_of_payment')
 
+        # Set by ProofUploadHandler when it refused the file mid-upload
+        upload_error = getattr(request, 'proof_upload_error', None)
+        if upload_error:
+            messages.error(request, upload_error)
+            return redirect('checkout')
+
         if not delivery_address:
             messages.error(request, 'Please provide a delivery address.')
             return redirect('checkout')
@@ -174,62 +227,65 @@ def checkout(request):
             messages.error(request, 'Please upload proof of payment.')
             return redirect('checkout')
 
-        # Create the order with pending status
-        order = Order.objects.create(
-            user=request.user,
-            status='pending',
-            total_amount=total,
-            delivery_address=delivery_address,
-            proof_of_payment=proof_of_payment
-        )
-
-        # Create order items from cart items
-        for cart_item in items:
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price  # Store current price
-            )
-
-        # Clear the cart
-        cart.cartitem_set.all().delete()
+        # The token identifies this checkout form so a double submit is harmless
+        checkout_token = _parse_checkout_token(request.POST.get('checkout_token')) or uuid.uuid4()
+        try:
+            order = place_order(request.user, delivery_address, proof_of_payment, checkout_token)
+        except CheckoutError as e:
+            messages.warning(request, str(e))
+            return redirect('view_cart')
 
         messages.success(request, f'Order #{order.id} has been submitted for approval! Your cart has been cleared.')
         return redirect('order_history')
 
+    totals = cart_totals(request.user)
+    if not totals['item_count']:
+        messages.warning(request, "Your cart is empty. Add items before checking out.")
+        return redirect('view_cart')
+
+    items = get_cart_items(request.user)
+    total = totals['total']
+
     # Render checkout page with payment details
     return render(request, 'checkout.html', {
         'items': items,
         'total': total,
+        'checkout_token': uuid.uuid4(),
         'account_number': '0123456789',
         'bank_name': 'GTBank',
         'account_name': 'JollyShop Nigeria Ltd'
     })
 
+def _parse_checkout_token(value):
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        return None
+
 @login_required
 def remove_from_cart(request, item_id):
     item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     item.delete()
+    invalidate_cart_summary(request.user)
     messages.success(request, 'Item removed from cart!')
     return redirect('view_cart')
 
 @login_required
 def increase_quantity(request, item_id):
     if request.method == 'POST':
-        item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        item.quantity += 1
-        item.save()
+        item = get_object_or_404(CartItem.objects.select_related('product'), id=item_id, cart__user=request.user)
+        # The quantity read above may already be stale; the increment happens in the database
+        change_quantity(request.user, item.id, 1)
+        invalidate_cart_summary(request.user)
         messages.success(request, f'Quantity of {item.product.name} increased!')
     return redirect('view_cart')
 
 @login_required
 def decrease_quantity(request, item_id):
     if request.method == 'POST':
-        item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        if item.quantity > 1:
-            item.quantity -= 1
-            item.save()
+        item = get_object_or_404(CartItem.objects.select_related('product'), id=item_id, cart__user=request.user)
+        if change_quantity(request.user, item.id, -1):
+            invalidate_cart_summary(request.user)
             messages.success(request, f'Quantity of {item.product.name} decreased!')
         else:
             messages.warning(request, 'Cannot decrease quantity below 1. Use remove instead.')
@@ -239,16 +295,32 @@ def decrease_quantity(request, item_id):
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def admin_dashboard(request):
-    users = User.objects.all()
-    total_users = users.count()
+    # One page of the user table; filters and cursors come from the query string
+    users = keyset_page(
+        filter_users(request.GET), after=parse_cursor(request.GET.get('after')),
+        before=parse_cursor(request.GET.get('before')), page_size=USER_PAGE_SIZE,
+    )
+    total_users = User.objects.count()
+    # Served from the partial index on completed orders
     total_orders = Order.objects.filter(status='completed').count()
     total_products = Product.objects.count()
-    carousel_images = library.objects.all()
+    # Every library row, including ones without an image, so staff can delete them;
+    # get_slides() is only for the public carousel
+    carousel_images = library.objects.order_by('id')
+    # Charts come from the daily rollups, so they cost the same however long the order history is
+    sales = dashboard_summary()
 
     if request.method == 'POST':
         form = LibraryForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
+            item = form.save(commit=False)
+            upload = request.FILES.get('imagee')
+            if upload:
+                # Shown in the carousel once the image pipeline has uploaded it
+                item.imagee = None
+            item.save()
+            if upload:
+                queue_derivatives(item, upload, upload_field='imagee')
             messages.success(request, 'Carousel image added successfully!')
             return redirect('admin_dashboard')
     else:
@@ -256,115 +328,159 @@ def admin_dashboard(request):
 
     return render(request, 'admin_dashboard.html', {
         'users': users,
+        'user_search': request.GET.get('search', ''),
+        'user_staff': request.GET.get('staff', ''),
+        'user_active': request.GET.get('active', ''),
+        'next_query': _page_query(request, after=users.next_cursor) if users.has_next else None,
+        'previous_query': _page_query(request, before=users.previous_cursor) if users.has_previous else None,
         'total_users': total_users,
         'total_orders': total_orders,
         'total_products': total_products,
         'carousel_images': carousel_images,
+        'sales': sales,
         'form': form,
     })
 
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+@query_budget(4)
+def admin_users(request):
+    """The admin dashboard's user table as JSON, one keyset page per request."""
+    users = keyset_page(
+        filter_users(request.GET), after=parse_cursor(request.GET.get('after')),
+        before=parse_cursor(request.GET.get('before')), page_size=USER_PAGE_SIZE,
+    )
+    return JsonResponse({
+        'results': [user_row(user) for user in users],
+        'next_cursor': users.next_cursor,
+        'previous_cursor': users.previous_cursor,
+    })
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def import_products_view(request):
+    report = None
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        fmt = request.POST.get('format') or os.path.splitext(upload.name if upload else '')[1].lstrip('.').lower()
+        if upload is None or fmt not in PRODUCT_FORMATS:
+            messages.error(request, 'Choose a CSV or JSONL file to import.')
+            return redirect('import_products')
+        # Rows are parsed as the upload is read, so large files never sit in memory whole
+        stream = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+        try:
+            report = import_products(read_rows(stream, fmt), dry_run=bool(request.POST.get('dry_run')))
+        except UnicodeDecodeError:
+            messages.error(request, 'The file must be UTF-8 encoded.')
+            return redirect('import_products')
+        if report.created or report.updated:
+            messages.success(request, f'{report.created} product(s) created, {report.updated} updated.')
+        if report.error_count:
+            messages.warning(request, f'{report.error_count} row(s) were rejected.')
+    return render(request, 'import_products.html', {
+        'report': report,
+        'formats': PRODUCT_FORMATS,
+    })
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def export_products_view(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in PRODUCT_FORMATS:
+        fmt = 'csv'
+    # Streamed row by row from a server-side iterator, so memory stays flat however many products there are
+    response = StreamingHttpResponse(serialize_rows(export_rows(), fmt), content_type=PRODUCT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+    return response
+
 # New order management view
 @login_required
 @user_passes_test(lambda u: u.is_staff)
+@query_budget(8)
 def order_management(request):
-    orders = Order.objects.all().order_by('-created_at').prefetch_related('items__product', 'user')
+    # Filtering on exactly ACTIVE_STATUSES lets the partial index skip order history
+    orders = Order.objects.filter(status__in=Order.ACTIVE_STATUSES).order_by('-created_at').prefetch_related('items__product', 'user')
     return render(request, 'order_management.html', {
         'orders': orders,
     })
 
-from django.core.mail import send_mail
-from django.conf import settings
-
-from django.utils import timezone
+# Flash message for each order that moved, keyed by its new status
+MODERATION_MESSAGES = {
+    'approved': 'Order #{} has been approved and user notified!',
+    'rejected': 'Order #{} has been rejected!',
+    'completed': 'Order #{} has been marked as completed!',
+}
+
+def _moderate_order(request, order_id, action):
+    # Notifications are queued with the status change and delivered by the
+    # deliver_notifications worker, so a slow mail server never holds up staff
+    result = moderate_orders([order_id], action, changed_by=request.user)[order_id]
+    if result == 'not_found':
+        raise Http404('No Order matches the given query.')
+    if result in MODERATION_MESSAGES:
+        messages.success(request, MODERATION_MESSAGES[result].format(order_id))
+    return redirect('order_management')
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def approve_order(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    if order.status == 'pending':
-        order.status = 'approved'
-        order.save()
-
-        # Create inbox message for the user
-        from datetime import timedelta
-        delivery_date = timezone.now() + timedelta(days=3)
-        inbox_subject = f"Order #{order.id} Approved - Delivery Scheduled"
-        inbox_message = f"Hello {order.user.username},\n\nYour order #{order.id} has been approved! Your package will be delivered within 3 days (by {delivery_date.strftime('%B %d, %Y')}).\n\nDelivery Address:\n{order.delivery_address}\n\nThank you for shopping with us!"
-
-        InboxMessage.objects.create(
-            user=order.user,
-            subject=inbox_subject,
-            message=inbox_message,
-            message_type='order_update'
-        )
-
-        # Send email to user about approval and delivery address
-        user_email = order.user.email
-        email_subject = f"Your Order #{order.id} has been Approved"
-        email_message = f"Hello {order.user.username},\n\nYour order #{order.id} has been approved. Please wait for delivery at the following address:\n\n{order.delivery_address}\n\nThank you for shopping with us!"
-        send_mail(email_subject, email_message, settings.DEFAULT_FROM_EMAIL, [user_email], fail_silently=True)
-
-        messages.success(request, f'Order #{order.id} has been approved and user notified!')
-    return redirect('order_management')
+    return _moderate_order(request, order_id, 'approve')
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def reject_order(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    if order.status == 'pending':
-        order.status = 'rejected'
-        order.save()
-        # Move to RejectedOrder table
-        from .models import RejectedOrder
-        RejectedOrder.objects.create(
-            original_order_id=order.id,
-            user=order.user,
-            created_at=order.created_at,
-            rejected_at=timezone.now(),
-            total_amount=order.total_amount,
-            delivery_address=order.delivery_address,
-            proof_of_payment=order.proof_of_payment,
-            rejection_reason="Rejected by admin"
-        )
-        order.delete()
-        messages.success(request, f'Order #{order.id} has been rejected and archived!')
-    return redirect('order_management')
+    return _moderate_order(request, order_id, 'reject')
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def complete_order(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    if order.status == 'approved':
-        order.status = 'completed'
-        order.save()
-        # Move to CompletedOrder table
-        from .models import CompletedOrder
-        CompletedOrder.objects.create(
-            original_order_id=order.id,
-            user=order.user,
-            created_at=order.created_at,
-            completed_at=timezone.now(),
-            total_amount=order.total_amount,
-            delivery_address=order.delivery_address,
-            proof_of_payment=order.proof_of_payment
-        )
-        order.delete()
-        messages.success(request, f'Order #{order_id} has been marked as completed and archived!')
+    return _moderate_order(request, order_id, 'complete')
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def bulk_moderate_orders(request):
+    if request.method != 'POST':
+        return redirect('order_management')
+
+    action = request.POST.get('action')
+    order_ids = [int(order_id) for order_id in request.POST.getlist('order_ids') if order_id.isdigit()]
+    if action not in MODERATION_ACTIONS or not order_ids:
+        if _wants_json(request):
+            return JsonResponse({'error': 'Choose an action and at least one order.'}, status=400)
+        messages.error(request, 'Choose an action and at least one order.')
+        return redirect('order_management')
+
+    results = moderate_orders(order_ids, action, changed_by=request.user)
+    if _wants_json(request):
+        return JsonResponse({'action': action, 'results': {str(order_id): result for order_id, result in results.items()}})
+
+    moved = [order_id for order_id, result in results.items() if result in MODERATION_MESSAGES]
+    skipped = [order_id for order_id, result in results.items() if result not in MODERATION_MESSAGES]
+    if moved:
+        messages.success(request, f'{len(moved)} order(s) {MODERATION_ACTIONS[action][1]}.')
+    if skipped:
+        messages.warning(request, 'Skipped orders not found or not in the right status: ' + ', '.join(f'#{order_id}' for order_id in skipped))
     return redirect('order_management')
 
+def _wants_json(request):
+    return request.accepts('application/json') and not request.accepts('text/html')
+
 # New contact messages view
 @login_required
 @user_passes_test(lambda u: u.is_staff)
+@replica_reads
+@query_budget(6)
 def completed_orders(request):
-    completed_orders = CompletedOrder.objects.all().order_by('-completed_at').prefetch_related('user')
+    completed_orders = Order.objects.filter(status='completed').order_by('-completed_at').select_related('user')
     return render(request, 'completed_orders.html', {
         'completed_orders': completed_orders,
     })
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
+@query_budget(6)
 def rejected_orders(request):
-    rejected_orders = RejectedOrder.objects.all().order_by('-rejected_at').prefetch_related('user')
+    rejected_orders = Order.objects.filter(status='rejected').order_by('-rejected_at').select_related('user')
     return render(request, 'rejected_orders.html', {
         'rejected_orders': rejected_orders,
     })
@@ -378,6 +494,8 @@ def contact_messages(request):
     })
 
 @login_required
+@replica_reads
+@query_budget(8)
 def order_history(request):
     orders = Order.objects.filter(user=request.user).exclude(status='pending').order_by('-created_at').prefetch_related('items__product')
     return render(request, 'order_history.html', {
@@ -385,6 +503,7 @@ def order_history(request):
     })
 
 @login_required
+@query_budget(8)
 def inbox(request):
     messages_list = InboxMessage.objects.filter(user=request.user).order_by('-created_at')
     unread_count = messages_list.filter(is_read=False).count()
@@ -409,10 +528,14 @@ def logout_view(request):
         return redirect('register')
     return redirect('product_list')
 
+@replica_reads
+@cache_anonymous_page
+@query_budget(5)
 def product_detail(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     return render(request, 'product_detail.html', {'product': product})
 
+@cache_anonymous_page
 def category_list(request):
     categories = Category.objects.all()
     return render(request, 'categories.html', {'categories': categories})
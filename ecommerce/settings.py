@@ -51,6 +51,8 @@ cloudinary.config(
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Mini_catalog.querybudget.QueryBudgetMiddleware',
+    'Mini_catalog.routing.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,6 +61,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL recording (X-Query-* headers and N+1 warnings). Turn it on
+# for staging load tests; QUERY_BUDGET_STRICT makes a view that exceeds its
+# @query_budget raise instead of logging a warning.
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=DEBUG, cast=bool)
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+QUERY_BUDGET_N_PLUS_ONE_THRESHOLD = 5
+
+# Tests always run with strict budgets, so a view that grows past its
+# @query_budget fails the suite instead of logging a warning
+TEST_RUNNER = 'Mini_catalog.querybudget.QueryBudgetTestRunner'
+
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
 ROOT_URLCONF = 'ecommerce.urls'
@@ -73,6 +86,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'Mini_catalog.context_processors.cart',
             ],
         },
     },
@@ -84,13 +98,168 @@ WSGI_APPLICATION = 'ecommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets reads carry on while a write
+# commits, so readers and the single writer stop blocking each other;
+# synchronous=NORMAL then only syncs at checkpoints, which is safe in WAL
+# mode (a power cut can lose the last commits but not corrupt the file).
+# The memory map and a bigger page cache (negative sizes are KiB) keep hot
+# pages out of read() calls. The journal mode is stored in the database file,
+# so only the first connection switches it; moving back out of WAL needs every
+# other connection closed.
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='WAL'),
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL'),
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'cache_size': -config('SQLITE_CACHE_KIB', default=64 * 1024, cast=int),
+}
+
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.sqlite3')
+DB_IS_SQLITE = DB_ENGINE == 'django.db.backends.sqlite3'
+
+# DB_ENGINE=django.db.backends.postgresql (with psycopg installed) plus
+# DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT switch to Postgres.
+# Connections are kept open for DB_CONN_MAX_AGE seconds instead of one per
+# request, and checked before reuse so a dropped one is replaced rather than
+# failing the request.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': DB_ENGINE,
+        'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default=''),
+        'PORT': config('DB_PORT', default=''),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        'OPTIONS': {
+            # Seconds to wait for the write lock before raising "database is locked"
+            'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+            'init_command': '; '.join(f'PRAGMA {name} = {value}' for name, value in SQLITE_PRAGMAS.items()),
+            # IMMEDIATE makes atomic() blocks take the write lock at BEGIN. A
+            # transaction that reads and then writes can otherwise fail at once
+            # when another connection wrote in between, as waiting could not
+            # help it. Every atomic() block here writes; set DEFERRED if
+            # read-only ones are added and should not queue for the lock.
+            'transaction_mode': config('SQLITE_TRANSACTION_MODE', default='IMMEDIATE'),
+        } if DB_IS_SQLITE else {},
+        # A file rather than SQLite's shared in-memory database, which fails
+        # concurrent writers at once instead of waiting, so tests can run
+        # several connections against it
+        'TEST': {'NAME': str(BASE_DIR / 'test_db.sqlite3')} if DB_IS_SQLITE else {},
     }
 }
 
+# Setting DB_REPLICA_NAME (or DB_REPLICA_HOST for Postgres) adds a read
+# replica. Catalog and order history pages read from it (see
+# Mini_catalog.routing); everything else, and every write, uses the primary.
+# Locally a copy of db.sqlite3 stands in for the replica. In tests an SQLite
+# replica gets its own database, so reads really come from a second file,
+# while a Postgres replica mirrors the primary.
+DB_REPLICA_NAME = config('DB_REPLICA_NAME', default='')
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+if DB_REPLICA_NAME or DB_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': DB_REPLICA_NAME or DATABASES['default']['NAME'],
+        'HOST': DB_REPLICA_HOST or DATABASES['default']['HOST'],
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'NAME': str(BASE_DIR / 'test_replica.sqlite3')} if DB_IS_SQLITE else {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['Mini_catalog.routing.ReplicaRouter']
+
+# How long a browser keeps reading from the primary after it changed
+# something, so it sees its own writes while the replica catches up. Keep it
+# above the replica's usual lag.
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory is per process. When running several workers, set
+# CACHE_BACKEND (e.g. django.core.cache.backends.redis.RedisCache) and
+# CACHE_LOCATION to a shared cache so cart badge and carousel invalidation
+# reach all of them; the system checks warn otherwise.
+
+# Worker processes serving requests; gunicorn reads the same variable
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+
+# Backend of the "sessions" cache, e.g. django.core.cache.backends.redis.RedisCache
+SESSION_CACHE_BACKEND = config('SESSION_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+SESSION_CACHE_SHARED = SESSION_CACHE_BACKEND != 'django.core.cache.backends.locmem.LocMemCache'
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    },
+    # Rendered product cards, keyed on product id and version so entries never
+    # go stale and are never deleted; old versions fall out by eviction. The
+    # local memory backend evicts the least recently used entry once
+    # MAX_ENTRIES is reached (CULL_FREQUENCY equal to MAX_ENTRIES drops one at
+    # a time) and stands in for Redis locally. Set FRAGMENT_CACHE_BACKEND to
+    # django.core.cache.backends.redis.RedisCache (with maxmemory-policy
+    # allkeys-lru) or ...filebased.FileBasedCache and FRAGMENT_CACHE_LOCATION
+    # to its URL or directory to share fragments between workers.
+    'fragments': {
+        'BACKEND': config('FRAGMENT_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('FRAGMENT_CACHE_LOCATION', default='product-fragments'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('FRAGMENT_CACHE_MAX_ENTRIES', default=5000, cast=int),
+            'CULL_FREQUENCY': config('FRAGMENT_CACHE_MAX_ENTRIES', default=5000, cast=int),
+        },
+    },
+    # Whole rendered catalog pages for anonymous visitors (Mini_catalog.pagecache)
+    'pages': {
+        'BACKEND': config('PAGE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('PAGE_CACHE_LOCATION', default='catalog-pages'),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('PAGE_CACHE_MAX_ENTRIES', default=1000, cast=int),
+        },
+    },
+    # Sessions for SESSION_STRATEGY=cached_db, kept for as long as the session
+    # itself. Only used with a shared SESSION_CACHE_BACKEND (see below).
+    'sessions': {
+        'BACKEND': SESSION_CACHE_BACKEND,
+        'LOCATION': config('SESSION_CACHE_LOCATION', default='sessions'),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('SESSION_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+}
+
+# Anonymous page cache for product_list, product_detail, category_list and
+# about. Product, category and carousel changes purge it; the timeout only
+# bounds how long a page can outlive a change made without signals.
+PAGE_CACHE_ENABLED = config('PAGE_CACHE_ENABLED', default=True, cast=bool)
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=600, cast=int)
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+# SESSION_STRATEGY picks where sessions live:
+#   cached_db       read from the "sessions" cache, falling back to
+#                   django_session on a miss; writes go to both, so nothing
+#                   is lost when the cache is cleared. The default when
+#                   SESSION_CACHE_BACKEND is shared between workers; with
+#                   local memory a logout would only clear the copy in the
+#                   worker that handled it, so the system checks reject it
+#   signed_cookies  in the browser, so requests never touch the database; a
+#                   copied cookie stays valid until it expires, as logout
+#                   cannot revoke it
+#   db              django_session on every request (Django's default, and
+#                   this project's without a shared session cache)
+# Expired rows are removed by manage.py clear_expired_sessions.
+SESSION_STRATEGY = config('SESSION_STRATEGY', default='cached_db' if SESSION_CACHE_SHARED else 'db')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_STRATEGY}'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Flash messages travel in a signed cookie to the next page instead of
+# falling back to the session, which loaded it on every request that used them
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,6 +310,27 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Notification outbox, delivered by `manage.py deliver_notifications`
+NOTIFICATION_BATCH_SIZE = 50
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_RETRY_DELAY = 60  # seconds before the first retry, doubled after each failure
+
+# Threads uploading new images to Cloudinary and rendering their derivatives in
+# the background (Mini_catalog.images). 0 runs that inline after the commit;
+# `manage.py process_images` picks up anything left pending.
+IMAGE_PIPELINE_WORKERS = config('IMAGE_PIPELINE_WORKERS', default=2, cast=int)
+
+# Proofs of payment are streamed to disk by Mini_catalog.uploads, which checks
+# size and type while the upload is still being read; other uploads use
+# Django's default handlers.
+FILE_UPLOAD_HANDLERS = [
+    'Mini_catalog.uploads.ProofUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+PROOF_UPLOAD_MAX_BYTES = config('PROOF_UPLOAD_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+PROOF_UPLOAD_CONTENT_TYPES = ['image/jpeg', 'image/png', 'image/webp', 'image/gif']
+
 # Authentication settings
 LOGIN_URL = '/login/'
 LOGOUT_REDIRECT_URL = '/register/'